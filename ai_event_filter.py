@@ -7,12 +7,14 @@ AI Event Filter - фильтрация контактов с событиями
 import json
 import asyncio
 import google.generativeai as genai
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Sequence, Union
+from dataclasses import dataclass, asdict
 from loguru import logger
 from datetime import datetime
 import re
 
+from vcf_normalizer_simple import Contact
+
 
 @dataclass
 class ExtractedContact:
@@ -117,14 +119,14 @@ class AIEventFilter:
 
     async def filter_events_from_contacts(
         self, 
-        contacts_data: List[Dict[str, Any]]
+        contacts_data: Sequence[Union[Contact, Dict[str, Any]]]
     ) -> List[ExtractedContact]:
         """
         Фильтрует события из контактов через Gemini AI
         Использует асинхронную параллельную обработку батчей
         
         Args:
-            contacts_data: список контактов с combined_text и phone
+            contacts_data: список контактов с combined_text и phone (Contact или dict)
             
         Returns:
             List[ExtractedContact]: список контактов с событиями
@@ -178,7 +180,7 @@ class AIEventFilter:
 
     async def _process_batch_async(
         self, 
-        batch: List[Dict[str, Any]], 
+        batch: Sequence[Union[Contact, Dict[str, Any]]], 
         batch_num: int, 
         total_batches: int
     ) -> List[ExtractedContact]:
@@ -212,17 +214,17 @@ class AIEventFilter:
                 logger.error(f"Ошибка при AI обработке батча {batch_num}: {e}")
                 return []
 
-    def _prepare_prompt_data(self, contacts_data: List[Dict[str, Any]]) -> str:
+    def _prepare_prompt_data(self, contacts_data: Sequence[Union[Contact, Dict[str, Any]]]) -> str:
         """
         Подготавливает данные для промпта AI в формате JSON.
         
         Args:
-            contacts_data: список контактов с combined_text и phone
+            contacts_data: список контактов с combined_text и phone (dict или Contact)
             
         Returns:
             str: подготовленные данные в JSON формате
         """
-        return json.dumps(contacts_data, ensure_ascii=False, indent=2)
+        return json.dumps(contacts_data, ensure_ascii=False, indent=2, default=asdict)
 
     async def _call_ai_async(self, prompt_data: str) -> str:
         """
@@ -5,7 +5,6 @@
 
 import os
 import asyncio
-import tempfile
 import threading
 import schedule
 import time
@@ -40,9 +39,34 @@ from table_assignment_manager import TableAssignmentManager
 from vcf_normalizer_simple import SimpleVCFNormalizer
 from ai_event_filter import AIEventFilter
 from google_sheets_manager import GoogleSheetsManager, ClientEvent
+from message_outbox import MessageOutbox
 
 load_dotenv()
 
+# Количество воркеров очереди ежедневных уведомлений (темп задают лимиты MessageOutbox)
+DAILY_NOTIFICATIONS_CONCURRENCY = 30
+
+# Шаблоны ежедневного уведомления (подставляются через str.format)
+_DAILY_WEEKDAYS = ('понедельник', 'вторник', 'среда', 'четверг', 'пятница', 'суббота', 'воскресенье')
+_DAILY_EVENTS_HEADER = (
+    "🌅 <b>Доброе утро!</b>\n\n"
+    "🎉 <b>События на сегодня, {weekday}, {date}:</b>\n\n"
+    "💡 <i>Кликайте на выделенные телефоны и поздравления для быстрого копирования</i>\n\n"
+)
+_DAILY_EVENT_LINE = "{i}. 👤 <b>{name}</b> 📞 <code>📋 {phone}</code> 🎉 {event_type} 📝 {note}\n"
+_DAILY_CONGRATULATION_BLOCK = "<blockquote>{}</blockquote>\n"
+_DAILY_DEFAULT_CONGRATULATION = "🎉 Поздравляем с праздником!"
+_DAILY_EVENTS_TOTAL = "\n<b>Всего: {count} событий</b>\n\n"
+_DAILY_EVENTS_FOOTER = "📊 Хорошего дня и успешных продаж! 💪"
+_DAILY_NO_EVENTS = (
+    "🌅 <b>Доброе утро!</b>\n\n"
+    "📅 <b>Сегодня, {weekday}, {date}</b>\n\n"
+    "😌 <b>Сегодня праздников нет</b>\n\n"
+    "🔍 Отличный день для поиска новых клиентов!\n"
+    "💼 Можете заняться другими важными делами или проанализировать предстоящие события.\n\n"
+    "📊 Хорошего дня и продуктивной работы! 💪"
+)
+
 class EventGREENBot:
     """EventGREEN Bot с интеграцией системы назначения таблиц"""
     
@@ -194,6 +218,7 @@ class EventGREENBot:
         else:
             # Новый пользователь - назначаем таблицу
             assigned_url = self.table_manager.assign_table_to_user(telegram_id, username)
+            self.sheets_manager.invalidate()  # В мастер-таблице появился новый пользователь
             
             if assigned_url:
                 welcome_message = f"""
@@ -534,27 +559,19 @@ class EventGREENBot:
                 "📥 Обрабатываю VCF файл...\n⏳ Это может занять несколько минут"
             )
             
-            # Скачиваем файл
+            # Скачиваем файл сразу в память, без временного файла и блокирующего чтения с диска
+            # (байты декодируются нормализатором по одной карточке)
             file = await context.bot.get_file(document.file_id)
-            
-            # Создаем временный файл
-            with tempfile.NamedTemporaryFile(suffix='.vcf', delete=False) as temp_file:
-                await file.download_to_drive(temp_file.name)
-                
-                # Читаем содержимое файла
-                with open(temp_file.name, 'r', encoding='utf-8') as f:
-                    vcf_content = f.read()
-                
-                # Удаляем временный файл
-                os.unlink(temp_file.name)
+            vcf_content = await file.download_as_bytearray()
             
             # Обрабатываем VCF
             await progress_message.edit_text(
                 "🔍 Парсинг контактов...\n⏳ Извлекаю данные из VCF"
             )
             
-            # VCF нормализатор возвращает массив {combined_text, phone}
-            contacts = self.vcf_normalizer.normalize_vcf(vcf_content)
+            # VCF нормализатор возвращает список Contact (combined_text, phone)
+            # (большие файлы разбираются в несколько процессов, цикл событий не блокируется)
+            contacts = await asyncio.to_thread(self.vcf_normalizer.normalize_vcf_parallel, vcf_content)
             
             if not contacts:
                 await progress_message.edit_text(
@@ -815,6 +832,7 @@ class EventGREENBot:
                             valueInputOption='USER_ENTERED',
                             body={'values': [[new_time, new_timezone]]}
                         ).execute()
+                        self.sheets_manager.invalidate()  # Строка пользователя изменилась в обход менеджера
                         
                         # Перезагружаем новый планировщик
                         self.notification_adapter.reload_scheduler()
@@ -854,6 +872,7 @@ class EventGREENBot:
                             valueInputOption='USER_ENTERED',
                             body={'values': [['disabled']]}
                         ).execute()
+                        self.sheets_manager.invalidate()  # Строка пользователя изменилась в обход менеджера
                         
                         self.notification_adapter.reload_scheduler()
                         
@@ -1019,85 +1038,10 @@ class EventGREENBot:
                 return
             
             # Фильтруем только нужных пользователей
-            target_users = [user for user in all_users if user.telegram_id in user_ids]
+            wanted_ids = set(user_ids)
+            target_users = [user for user in all_users if user.telegram_id in wanted_ids]
             
-            for user in target_users:
-                try:
-                    # Получаем события на сегодня для этого пользователя с retry логикой
-                    today_events = None
-                    max_event_retries = 3
-                    
-                    for attempt in range(max_event_retries):
-                        try:
-                            today_events = self.sheets_manager.get_today_events(user)
-                            break  # Успешно получили события
-                        except Exception as e:
-                            print(f"⚠️ Попытка {attempt + 1} получения событий для {user.username}: {e}")
-                            if attempt < max_event_retries - 1:
-                                print(f"🔄 Повторяем через 2 секунды...")
-                                await asyncio.sleep(2)
-                            else:
-                                print(f"❌ Не удалось получить события для {user.username}")
-                                today_events = []  # Пустой список если не удалось
-                    
-                    # Формируем сообщение с датой (всегда отправляем уведомление)
-                    from datetime import datetime
-                    today_date = datetime.now()
-                    weekdays = ['понедельник', 'вторник', 'среда', 'четверг', 'пятница', 'суббота', 'воскресенье']
-                    weekday = weekdays[today_date.weekday()]
-                    date_str = today_date.strftime('%d.%m.%Y')
-                    
-                    message = "🌅 <b>Доброе утро!</b>\n\n"
-                    
-                    if today_events:
-                        # Есть события на сегодня
-                        # Загружаем поздравления для утренних уведомлений
-                        congratulations_map = self.sheets_manager.get_congratulations_map()
-                        
-                        message += f"🎉 <b>События на сегодня, {weekday}, {date_str}:</b>\n\n"
-                        message += "💡 <i>Кликайте на выделенные телефоны и поздравления для быстрого копирования</i>\n\n"
-                        
-                        for i, event in enumerate(today_events, 1):  # Показываем ВСЕ события
-                            # Структурированный формат с полями
-                            name = event.name if event.name and event.name.strip() else "NULL"
-                            phone = event.phone if event.phone and event.phone.strip() else "NULL"
-                            event_type = event.event_type if event.event_type and event.event_type.strip() and event.event_type.lower() != "неизвестно" else "NULL"
-                            note = event.note if event.note and event.note.strip() else "NULL"
-                            
-                            # Формируем строку с явными полями
-                            message += f"{i}. 👤 <b>{name}</b> 📞 <code>📋 {phone}</code> 🎉 {event_type} 📝 {note}\n"
-                            
-                            # Поздравление
-                            event_type_lower = event.event_type.lower() if event.event_type and event.event_type.strip() else "неизвестно"
-                            congratulation = congratulations_map.get(event_type_lower, congratulations_map.get("неизвестно", "🎉 Поздравляем с праздником!"))
-                            message += f"<blockquote>{congratulation}</blockquote>\n"
-                        
-                        message += f"\n<b>Всего: {len(today_events)} событий</b>\n\n"
-                        message += "📊 Хорошего дня и успешных продаж! 💪"
-                    else:
-                        # Нет событий на сегодня
-                        message += f"📅 <b>Сегодня, {weekday}, {date_str}</b>\n\n"
-                        message += "😌 <b>Сегодня праздников нет</b>\n\n"
-                        message += "🔍 Отличный день для поиска новых клиентов!\n"
-                        message += "💼 Можете заняться другими важными делами или проанализировать предстоящие события.\n\n"
-                        message += "📊 Хорошего дня и продуктивной работы! 💪"
-                    
-                    # Отправляем уведомление (всегда)
-                    await self.application.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=message,
-                        parse_mode=ParseMode.HTML,
-                        disable_web_page_preview=True
-                    )
-                    
-                    if today_events:
-                        print(f"✅ Уведомление с {len(today_events)} событиями отправлено пользователю {user.username}")
-                    else:
-                        print(f"✅ Уведомление без событий отправлено пользователю {user.username}")
-                        
-                except Exception as e:
-                    print(f"❌ Ошибка отправки уведомления пользователю {user.telegram_id}: {e}")
-                    continue
+            await self._send_daily_notifications_to(target_users)
             
             print(f"📅 Уведомления для группы завершены ({len(target_users)} пользователей)")
             
@@ -1261,80 +1205,108 @@ class EventGREENBot:
             print("📅 Запуск ежедневных уведомлений...")
             
             # Получаем всех пользователей из мастер таблицы
-            users = self.sheets_manager.get_all_trial_and_pro_users()
+            users = [user for user in self.sheets_manager.get_all_trial_and_pro_users() if user.telegram_id]
             
-            for user in users:
-                if not user.telegram_id or user.telegram_id == "":
-                    continue
-                    
-                try:
-                    # Получаем события на сегодня для пользователя
-                    today_events = self.sheets_manager.get_today_events(user)
-                    
-                    # Формируем сообщение с датой (всегда отправляем уведомление)
-                    from datetime import datetime
-                    today_date = datetime.now()
-                    weekdays = ['понедельник', 'вторник', 'среда', 'четверг', 'пятница', 'суббота', 'воскресенье']
-                    weekday = weekdays[today_date.weekday()]
-                    date_str = today_date.strftime('%d.%m.%Y')
-                    
-                    message = "🌅 <b>Доброе утро!</b>\n\n"
-                    
-                    if today_events:
-                        # Есть события на сегодня
-                        # Загружаем поздравления для утренних уведомлений
-                        congratulations_map = self.sheets_manager.get_congratulations_map()
-                        
-                        message += f"🎉 <b>События на сегодня, {weekday}, {date_str}:</b>\n\n"
-                        message += "💡 <i>Кликайте на выделенные телефоны и поздравления для быстрого копирования</i>\n\n"
-                        
-                        for i, event in enumerate(today_events, 1):  # Показываем ВСЕ события
-                            # Структурированный формат с полями
-                            name = event.name if event.name and event.name.strip() else "NULL"
-                            phone = event.phone if event.phone and event.phone.strip() else "NULL"
-                            event_type = event.event_type if event.event_type and event.event_type.strip() and event.event_type.lower() != "неизвестно" else "NULL"
-                            note = event.note if event.note and event.note.strip() else "NULL"
-                            
-                            # Формируем строку с явными полями
-                            message += f"{i}. 👤 <b>{name}</b> 📞 <code>📋 {phone}</code> 🎉 {event_type} 📝 {note}\n"
-                            
-                            # Поздравление
-                            event_type_lower = event.event_type.lower() if event.event_type and event.event_type.strip() else "неизвестно"
-                            congratulation = congratulations_map.get(event_type_lower, congratulations_map.get("неизвестно", "🎉 Поздравляем с праздником!"))
-                            message += f"<blockquote>{congratulation}</blockquote>\n"
-                        
-                        message += f"\n<b>Всего: {len(today_events)} событий</b>\n\n"
-                        message += "📊 Хорошего дня и успешных продаж! 💪"
-                    else:
-                        # Нет событий на сегодня
-                        message += f"📅 <b>Сегодня, {weekday}, {date_str}</b>\n\n"
-                        message += "😌 <b>Сегодня праздников нет</b>\n\n"
-                        message += "🔍 Отличный день для поиска новых клиентов!\n"
-                        message += "💼 Можете заняться другими важными делами или проанализировать предстоящие события.\n\n"
-                        message += "📊 Хорошего дня и продуктивной работы! 💪"
-                    
-                    # Отправляем уведомление (всегда)
-                    await self.application.bot.send_message(
-                        chat_id=int(user.telegram_id),
-                        text=message,
-                        parse_mode=ParseMode.HTML,
-                        disable_web_page_preview=True
-                    )
-                    
-                    if today_events:
-                        print(f"✅ Уведомление с {len(today_events)} событиями отправлено пользователю {user.telegram_id}")
-                    else:
-                        print(f"✅ Уведомление без событий отправлено пользователю {user.telegram_id}")
-                    
-                except Exception as e:
-                    print(f"❌ Ошибка отправки уведомления пользователю {user.telegram_id}: {e}")
-                    continue
+            await self._send_daily_notifications_to(users)
             
             print("📅 Ежедневные уведомления завершены")
             
         except Exception as e:
             print(f"💥 Ошибка в ежедневных уведомлениях: {e}")
     
+    async def _send_daily_notifications_to(self, users: list):
+        """
+        Рассылает ежедневные уведомления указанным пользователям
+        
+        Общий путь для планировщика и ручного запуска: события всех пользователей
+        читаются одной параллельной выборкой, поздравления - один раз, а сообщения
+        уходят через MessageOutbox с лимитами Telegram.
+        """
+        if not users:
+            return
+        
+        # Читаем события всех пользователей заранее, параллельно (одна выборка на весь запуск)
+        events_by_user = await asyncio.to_thread(self.sheets_manager.get_today_events_bulk, users)
+        
+        # Общие для всех пользователей части сообщений - один раз на запуск
+        congratulations_map = await asyncio.to_thread(self.sheets_manager.get_congratulations_map)
+        templates = self._build_daily_templates(congratulations_map)
+        
+        # Рассылаем через очередь с глобальным и per-chat лимитами Telegram
+        async with MessageOutbox(self.application.bot, workers=DAILY_NOTIFICATIONS_CONCURRENCY) as outbox:
+            await asyncio.gather(*(
+                self._notify_one(user, events_by_user.get(user.telegram_id, []), outbox, templates) for user in users
+            ))
+    
+    def _build_daily_templates(self, congratulations_map: dict) -> dict:
+        """Готовит заголовки, подвалы и блоки поздравлений ежедневного уведомления"""
+        from datetime import datetime
+        today_date = datetime.now()
+        day = {'weekday': _DAILY_WEEKDAYS[today_date.weekday()], 'date': today_date.strftime('%d.%m.%Y')}
+        
+        # Ключи карты поздравлений уже в нижнем регистре
+        congratulation_blocks = {
+            event_type: _DAILY_CONGRATULATION_BLOCK.format(text)
+            for event_type, text in congratulations_map.items()
+        }
+        default_block = congratulation_blocks.get(
+            "неизвестно", _DAILY_CONGRATULATION_BLOCK.format(_DAILY_DEFAULT_CONGRATULATION)
+        )
+        
+        return {
+            'events_header': _DAILY_EVENTS_HEADER.format_map(day),
+            'no_events': _DAILY_NO_EVENTS.format_map(day),
+            'congratulations': congratulation_blocks,
+            'default_congratulation': default_block,
+        }
+    
+    def _format_daily_message(self, today_events: list, templates: dict) -> str:
+        """Собирает текст ежедневного уведомления из шаблонов _build_daily_templates"""
+        if not today_events:
+            # Нет событий на сегодня - текст одинаковый для всех
+            return templates['no_events']
+        
+        congratulation_blocks = templates['congratulations']
+        default_block = templates['default_congratulation']
+        parts = [templates['events_header']]
+        
+        for i, event in enumerate(today_events, 1):  # Показываем ВСЕ события
+            # Структурированный формат с полями
+            event_type_lower = event.event_type.lower() if event.event_type and event.event_type.strip() else "неизвестно"
+            parts.append(_DAILY_EVENT_LINE.format(
+                i=i,
+                name=event.name if event.name and event.name.strip() else "NULL",
+                phone=event.phone if event.phone and event.phone.strip() else "NULL",
+                event_type=event.event_type if event_type_lower != "неизвестно" else "NULL",
+                note=event.note if event.note and event.note.strip() else "NULL",
+            ))
+            parts.append(congratulation_blocks.get(event_type_lower, default_block))
+        
+        parts.append(_DAILY_EVENTS_TOTAL.format(count=len(today_events)))
+        parts.append(_DAILY_EVENTS_FOOTER)
+        return "".join(parts)
+    
+    async def _notify_one(self, user, today_events: list, outbox: MessageOutbox, templates: dict):
+        """Готовит и отправляет ежедневное уведомление одному пользователю"""
+        try:
+            message = self._format_daily_message(today_events, templates)
+            
+            # Отправляем уведомление (всегда); очередь сама повторяет после RetryAfter от Telegram
+            await outbox.send(
+                int(user.telegram_id),
+                message,
+                parse_mode=ParseMode.HTML,
+                disable_web_page_preview=True
+            )
+            
+            if today_events:
+                print(f"✅ Уведомление с {len(today_events)} событиями отправлено пользователю {user.telegram_id}")
+            else:
+                print(f"✅ Уведомление без событий отправлено пользователю {user.telegram_id}")
+            
+        except Exception as e:
+            print(f"❌ Ошибка отправки уведомления пользователю {user.telegram_id}: {e}")
+    
     
     def _schedule_daily_notifications(self):
         """Настройка индивидуального планировщика для каждого пользователя"""
@@ -1570,6 +1542,7 @@ class EventGREENBot:
                         valueInputOption='USER_ENTERED',
                         body={'values': [['disabled']]}
                     ).execute()
+                    self.sheets_manager.invalidate()  # Строка пользователя изменилась в обход менеджера
                     
                     self.notification_scheduler.reload_scheduler()
                     
@@ -1751,6 +1724,14 @@ class EventGREENBot:
                 raise
 
 if __name__ == "__main__":
+    # uvloop (если установлен) - более быстрый цикл событий для сетевой нагрузки Telegram
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        print("⚡ Используется uvloop")
+    except ImportError:
+        pass
+    
     try:
         bot = EventGREENBot()
         bot.run()
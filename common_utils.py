@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+ОБЩИЕ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
+Используются планировщиками уведомлений, адаптером и менеджером Google Sheets.
+Модуль не загружает threading и pytz при импорте - его подключает и Workers-планировщик.
+"""
+
+from functools import lru_cache
+from itertools import islice
+from typing import Iterator, List
+
+try:
+    import orjson
+except ImportError:  # orjson опционален - без него работает стандартный json
+    orjson = None
+
+
+def chunked(user_ids: List[str], size: int) -> Iterator[List[str]]:
+    """Разбивает список пользователей на батчи по size элементов"""
+    iterator = iter(user_ids)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@lru_cache(maxsize=None)
+def get_tz(name: str):
+    """Возвращает pytz-зону по имени (одна загрузка на уникальную зону)"""
+    import pytz
+    return pytz.timezone(name)
@@ -5,19 +5,68 @@ Google Sheets Manager для EventGREEN Bot
 """
 
 import os
+import re
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
+import httplib2
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.model import JsonModel
 from loguru import logger
 from dotenv import load_dotenv
 
+from common_utils import orjson
+
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
+# Время жизни кэша карты поздравлений в секундах
+CONGRATULATIONS_CACHE_TTL = 300
+
+# Время жизни кэша списка активных пользователей в секундах
+ACTIVE_USERS_CACHE_TTL = 60
+
+# Сколько клиентских таблиц читать параллельно в get_today_events_bulk
+TODAY_EVENTS_MAX_WORKERS = 10
+
+# ID таблицы в URL вида: https://docs.google.com/spreadsheets/d/ID/edit...
+_SHEET_ID_RE = re.compile(r'/d/([a-zA-Z0-9_-]+)')
+
+
+class OrjsonModel(JsonModel):
+    """JsonModel, декодирующий ответы Google API через orjson (быстрее stdlib json на больших таблицах)"""
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # Не JSON - отдаем стандартной реализации
+            return super().deserialize(content)
+
+        if self._data_wrapper and isinstance(body, dict) and 'data' in body:
+            body = body['data']
+        return body
+
+
+def _api_model() -> Optional[JsonModel]:
+    """Модель ответов для build(): orjson если установлен, иначе стандартная"""
+    return OrjsonModel() if orjson is not None else None
+
+
+@lru_cache(maxsize=1024)
+def _extract_sheet_id(url: str) -> str:
+    """Извлекает ID таблицы из URL (пустая строка если ID не найден)"""
+    match = _SHEET_ID_RE.search(url) if url else None
+    return match.group(1) if match else ''
+
 
 @dataclass
 class User:
@@ -30,6 +79,10 @@ class User:
     created_at: str
     notification_time: str = "20:15"  # время уведомлений (по умолчанию 20:15)
     timezone: str = "Asia/Almaty"     # временная зона (по умолчанию Алматы)
+    sheet_id: str = field(default='', init=False)  # ID таблицы, извлекается из sheet_url
+    
+    def __post_init__(self):
+        self.sheet_id = _extract_sheet_id(self.sheet_url)
 
 
 @dataclass
@@ -62,19 +115,30 @@ class GoogleSheetsManager:
         else:
             self.master_sheet_id = None
         
+        # Кэш карты поздравлений: (временной бакет, версия мастер-таблицы, карта)
+        self._congratulations_cache = None
+        
+        # Кэш активных пользователей: (monotonic время чтения, список)
+        self._active_users_cache = None
+        
         # Инициализируем сервисы
         self.sheets_service = None
         self.drive_service = None
+        self._credentials = None
+        self._thread_local = threading.local()  # httplib2.Http не потокобезопасен - свой на поток
         self._init_services()
     
+    def invalidate(self):
+        """Сбрасывает кэши пользователей и поздравлений (после изменений в мастер-таблице)"""
+        self._active_users_cache = None
+        self._congratulations_cache = None
+    
     def _extract_sheet_id(self, url: str) -> str:
         """Извлекает ID таблицы из URL"""
-        try:
-            # URL вида: https://docs.google.com/spreadsheets/d/ID/edit...
-            return url.split('/d/')[1].split('/')[0]
-        except (IndexError, AttributeError):
+        sheet_id = _extract_sheet_id(url)
+        if not sheet_id:
             logger.error(f"Не удалось извлечь ID из URL: {url}")
-            return ""
+        return sheet_id
     
     def _init_services(self):
         """Инициализирует сервисы Google API"""
@@ -87,8 +151,9 @@ class GoogleSheetsManager:
                 ]
             )
             
-            self.sheets_service = build('sheets', 'v4', credentials=credentials)
-            self.drive_service = build('drive', 'v3', credentials=credentials)
+            self._credentials = credentials
+            self.sheets_service = build('sheets', 'v4', credentials=credentials, model=_api_model())
+            self.drive_service = build('drive', 'v3', credentials=credentials, model=_api_model())
             
             logger.info("✅ Google API сервисы инициализированы")
             
@@ -191,6 +256,7 @@ class GoogleSheetsManager:
                 body={'values': [new_user_data]}
             ).execute()
             
+            self.invalidate()
             logger.info(f"✅ Пользователь {telegram_id} создан с пробным периодом до {expires_at}")
             
             return User(
@@ -277,19 +343,15 @@ class GoogleSheetsManager:
             True если успешно добавлено
         """
         try:
-            user_sheet_id = self._extract_sheet_id(user.sheet_url)
+            user_sheet_id = user.sheet_id
             
             # Добавляем идеальных клиентов
             if ideal_clients:
-                ideal_data = []
-                for client in ideal_clients:
-                    ideal_data.append([
-                        client.name or 'Неизвестно',
-                        client.phone,
-                        client.event_type or 'Событие',
-                        client.event_date or '',
-                        client.note or ''
-                    ])
+                # Значения по умолчанию - только при записи, при чтении поля остаются как в таблице
+                ideal_data = [
+                    [c.name or 'Неизвестно', c.phone, c.event_type or 'Событие', c.event_date or '', c.note or '']
+                    for c in ideal_clients
+                ]
                 
                 self.sheets_service.spreadsheets().values().append(
                     spreadsheetId=user_sheet_id,
@@ -302,15 +364,11 @@ class GoogleSheetsManager:
             
             # Добавляем потенциальных клиентов
             if potential_clients:
-                potential_data = []
-                for client in potential_clients:
-                    potential_data.append([
-                        client.name or 'Неизвестно',
-                        client.phone,
-                        client.event_type or 'Потенциальный интерес',
-                        '',  # Дата пустая для потенциальных
-                        client.note or ''
-                    ])
+                # Дата пустая для потенциальных
+                potential_data = [
+                    [c.name or 'Неизвестно', c.phone, c.event_type or 'Потенциальный интерес', '', c.note or '']
+                    for c in potential_clients
+                ]
                 
                 self.sheets_service.spreadsheets().values().append(
                     spreadsheetId=user_sheet_id,
@@ -327,13 +385,50 @@ class GoogleSheetsManager:
             logger.error(f"Ошибка добавления клиентов в таблицу пользователя: {e}")
             return False
     
+    def _get_master_sheet_version(self) -> Optional[str]:
+        """
+        Получает номер версии мастер-таблицы из Drive (дешевый аналог ETag)
+        
+        Returns:
+            Версия файла или None если получить не удалось
+        """
+        try:
+            file_meta = self.drive_service.files().get(
+                fileId=self.master_sheet_id,
+                fields='version'
+            ).execute(http=self._thread_http())
+            return file_meta.get('version')
+            
+        except Exception as e:
+            logger.warning(f"Не удалось получить версию мастер-таблицы: {e}")
+            return None
+    
     def get_congratulations_map(self) -> Dict[str, str]:
         """
         Загружает карту поздравлений из мастер таблицы
         
+        Карта кэшируется на CONGRATULATIONS_CACHE_TTL секунд. По истечении
+        срока сначала сверяется версия мастер-таблицы, и лист перечитывается
+        только если таблица изменилась.
+        
+        Запросы идут через HTTP-клиент текущего потока - метод вызывается
+        и из event loop бота, и из рабочих потоков (asyncio.to_thread).
+        
         Returns:
             Dict[str, str]: словарь {тип_события: текст_поздравления}
         """
+        bucket = int(time.time() // CONGRATULATIONS_CACHE_TTL)
+        cache = self._congratulations_cache
+        
+        if cache and cache[0] == bucket:
+            return cache[2]
+        
+        version = self._get_master_sheet_version()
+        if cache and version and cache[1] == version:
+            # Таблица не менялась - продлеваем кэш без чтения листа
+            self._congratulations_cache = (bucket, version, cache[2])
+            return cache[2]
+        
         try:
             # Читаем лист "Поздравления" из мастер таблицы
             range_name = "Поздравления!A2:B1000"  # Пропускаем заголовок
@@ -341,7 +436,7 @@ class GoogleSheetsManager:
             result = self.sheets_service.spreadsheets().values().get(
                 spreadsheetId=self.master_sheet_id,
                 range=range_name
-            ).execute()
+            ).execute(http=self._thread_http())
             
             values = result.get('values', [])
             congratulations = {}
@@ -353,6 +448,9 @@ class GoogleSheetsManager:
                     congratulations[event_type] = congratulation_text
             
             logger.info(f"Загружено {len(congratulations)} поздравлений")
+            
+            if congratulations:
+                self._congratulations_cache = (bucket, version, congratulations)
             return congratulations
             
         except Exception as e:
@@ -370,32 +468,15 @@ class GoogleSheetsManager:
             Список событий на сегодня
         """
         try:
-            user_sheet_id = self._extract_sheet_id(user.sheet_url)
             today = datetime.now().strftime('%Y-%m-%d')
             
             # Читаем лист "Идеальные клиенты"
             result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=user_sheet_id,
+                spreadsheetId=user.sheet_id,
                 range="'✅ Идеальные клиенты'!A:E"
             ).execute()
             
-            values = result.get('values', [])
-            today_events = []
-            
-            # Пропускаем заголовок и ищем события на сегодня
-            for row in values[1:]:
-                if len(row) >= 4:
-                    event_date = row[3] if len(row) > 3 else ''
-                    
-                    # Проверяем различные форматы дат
-                    if self._is_today(event_date, today):
-                        today_events.append(ClientEvent(
-                            name=row[0] if len(row) > 0 else 'Неизвестно',
-                            phone=row[1] if len(row) > 1 else '',
-                            event_type=row[2] if len(row) > 2 else 'Событие',
-                            event_date=event_date,
-                            note=row[4] if len(row) > 4 else ''
-                        ))
+            today_events = self._parse_today_events(result.get('values', []), today)
             
             logger.info(f"Найдено {len(today_events)} событий на сегодня")
             return today_events
@@ -404,6 +485,68 @@ class GoogleSheetsManager:
             logger.error(f"Ошибка получения событий на сегодня: {e}")
             return []
     
+    def get_today_events_bulk(self, users: List[User]) -> Dict[str, List[ClientEvent]]:
+        """
+        Получает события на сегодня сразу для нескольких пользователей
+        
+        У каждого пользователя своя таблица, поэтому один batchGet на всех
+        невозможен - таблицы читаются параллельно в пуле потоков.
+        
+        Args:
+            users: пользователи
+            
+        Returns:
+            Словарь telegram_id -> список событий на сегодня
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        
+        def fetch(user: User) -> List[ClientEvent]:
+            try:
+                result = self.sheets_service.spreadsheets().values().get(
+                    spreadsheetId=user.sheet_id,
+                    range="'✅ Идеальные клиенты'!A:E"
+                ).execute(http=self._thread_http())
+                return self._parse_today_events(result.get('values', []), today)
+            except Exception as e:
+                logger.error(f"Ошибка получения событий на сегодня для {user.telegram_id}: {e}")
+                return []
+        
+        with ThreadPoolExecutor(max_workers=TODAY_EVENTS_MAX_WORKERS) as executor:
+            events = list(executor.map(fetch, users))
+        
+        events_by_user = {user.telegram_id: user_events for user, user_events in zip(users, events)}
+        logger.info(f"Найдено {sum(map(len, events))} событий на сегодня для {len(users)} пользователей")
+        return events_by_user
+    
+    def _thread_http(self) -> AuthorizedHttp:
+        """Авторизованный HTTP-клиент текущего потока (httplib2.Http нельзя делить между потоками)"""
+        http = getattr(self._thread_local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(self._credentials, http=httplib2.Http())
+            self._thread_local.http = http
+        return http
+    
+    def _parse_today_events(self, values: List[list], today: str) -> List[ClientEvent]:
+        """Выбирает из строк листа "Идеальные клиенты" события на сегодня"""
+        today_events = []
+        
+        # Пропускаем заголовок и ищем события на сегодня
+        for row in values[1:]:
+            if len(row) >= 4:
+                event_date = row[3]
+                
+                # Проверяем различные форматы дат
+                if self._is_today(event_date, today):
+                    today_events.append(ClientEvent(
+                        name=row[0],
+                        phone=row[1],
+                        event_type=row[2],
+                        event_date=event_date,
+                        note=row[4] if len(row) > 4 else ''
+                    ))
+        
+        return today_events
+    
     def _is_today(self, event_date: str, today: str) -> bool:
         """
         Проверяет соответствует ли дата события сегодняшнему дню
@@ -441,7 +584,7 @@ class GoogleSheetsManager:
             Список потенциальных клиентов
         """
         try:
-            user_sheet_id = self._extract_sheet_id(user.sheet_url)
+            user_sheet_id = user.sheet_id
             
             # Читаем лист "Потенциальные клиенты"
             result = self.sheets_service.spreadsheets().values().get(
@@ -486,9 +629,16 @@ class GoogleSheetsManager:
         """
         Получает всех пользователей со статусом trial или pro для CRON рассылки
         
+        Список кэшируется на ACTIVE_USERS_CACHE_TTL секунд; после изменений
+        в мастер-таблице кэш сбрасывается через invalidate().
+        
         Returns:
             Список пользователей
         """
+        cache = self._active_users_cache
+        if cache and time.monotonic() - cache[0] < ACTIVE_USERS_CACHE_TTL:
+            return list(cache[1])
+        
         try:
             if not self.master_sheet_id:
                 logger.error("Master sheet ID не настроен")
@@ -524,7 +674,8 @@ class GoogleSheetsManager:
                         ))
             
             logger.info(f"Найдено {len(active_users)} активных пользователей")
-            return active_users
+            self._active_users_cache = (time.monotonic(), active_users)
+            return list(active_users)
             
         except Exception as e:
             logger.error(f"Ошибка получения активных пользователей: {e}")
@@ -592,6 +743,7 @@ class GoogleSheetsManager:
                 body=body
             ).execute()
             
+            self.invalidate()
             logger.info(f"Настройки уведомлений обновлены для пользователя {telegram_id}: {notification_time} {timezone}")
             return True
             
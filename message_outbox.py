@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+ОЧЕРЕДЬ ИСХОДЯЩИХ СООБЩЕНИЙ TELEGRAM
+Отправляет сообщения пулом воркеров с глобальным лимитом (~30 сообщений/сек)
+и лимитом на чат (1 сообщение/сек). После RetryAfter сообщение возвращается
+в очередь, а все воркеры ждут указанное Telegram время.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+from loguru import logger
+from telegram.error import RetryAfter
+
+
+# Лимиты Telegram Bot API
+GLOBAL_RATE_PER_SECOND = 30
+PER_CHAT_INTERVAL = 1.0
+
+# Количество одновременных отправок (запросы к API идут параллельно, темп задают лимиты)
+DEFAULT_WORKERS = 30
+
+
+class MessageOutbox:
+    """
+    Очередь исходящих сообщений с ограничением скорости
+
+    Использование:
+        async with MessageOutbox(application.bot) as outbox:
+            await outbox.send(chat_id, text, parse_mode=ParseMode.HTML)
+
+    При выходе из контекста очередь дожидается доставки всех сообщений.
+    """
+
+    def __init__(self,
+                 bot,
+                 global_rate: float = GLOBAL_RATE_PER_SECOND,
+                 per_chat_interval: float = PER_CHAT_INTERVAL,
+                 workers: int = DEFAULT_WORKERS):
+        """
+        Args:
+            bot: объект с async send_message (telegram.Bot)
+            global_rate: максимум сообщений в секунду на всего бота
+            per_chat_interval: минимальный интервал между сообщениями в один чат (сек)
+            workers: количество воркеров-отправителей
+        """
+        self._bot = bot
+        self._global_interval = 1.0 / global_rate
+        self._per_chat_interval = per_chat_interval
+        self._workers_count = workers
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+        # Время (loop.time()) следующего свободного глобального слота и готовности каждого чата
+        self._next_global_slot = 0.0
+        self._chat_ready_at: Dict[Any, float] = {}
+
+    async def __aenter__(self) -> "MessageOutbox":
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        """Запускает воркеров в текущем event loop"""
+        if self._queue is not None:
+            return
+
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+
+    async def close(self):
+        """Дожидается доставки всей очереди и останавливает воркеров"""
+        if self._queue is None:
+            return
+
+        await self._queue.join()
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+        self._queue = None
+        self._workers = []
+
+    async def send(self, chat_id, text: str, **kwargs):
+        """
+        Ставит сообщение в очередь и ждет его доставки
+
+        Returns:
+            Результат bot.send_message (исключения отправки пробрасываются вызывающему)
+        """
+        if self._queue is None:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((chat_id, text, kwargs, future))
+        return await future
+
+    async def _wait_turn(self, chat_id):
+        """Ждет очереди чата, затем резервирует и ждет глобальный слот"""
+        loop = asyncio.get_running_loop()
+
+        # Резервирование без await между чтением и записью - гонок между воркерами нет
+        now = loop.time()
+        chat_ready = max(now, self._chat_ready_at.get(chat_id, 0.0))
+        self._chat_ready_at[chat_id] = chat_ready + self._per_chat_interval
+        if chat_ready > now:
+            await asyncio.sleep(chat_ready - now)
+
+        # Глобальный слот берем только когда чат готов, чтобы не занимать его впустую
+        now = loop.time()
+        slot = max(now, self._next_global_slot)
+        self._next_global_slot = slot + self._global_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _worker(self):
+        """Забирает сообщения из очереди и отправляет их с учетом лимитов"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            chat_id, text, kwargs, future = await self._queue.get()
+            try:
+                if future.done():
+                    # Отправитель уже не ждет (отменен)
+                    continue
+
+                await self._wait_turn(chat_id)
+
+                try:
+                    result = await self._bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                except RetryAfter as e:
+                    # Флуд-контроль Telegram общий на бота - притормаживаем всех воркеров
+                    logger.warning(f"⏳ Telegram просит подождать {e.retry_after} сек (чат {chat_id})")
+                    self._next_global_slot = max(self._next_global_slot, loop.time() + e.retry_after)
+                    self._queue.put_nowait((chat_id, text, kwargs, future))
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
@@ -6,12 +6,15 @@
 
 import os
 import asyncio
+from functools import lru_cache
 from typing import List, Callable, Dict
 from loguru import logger
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
+from common_utils import chunked
 
-@dataclass
+
+@dataclass(slots=True)
 class NotificationUser:
     """Пользователь для системы уведомлений"""
     telegram_id: str
@@ -28,6 +31,47 @@ class NotificationConfig:
     fallback_to_local: bool = True
     webhook_url: str = ""
     environment: str = "local"  # "local", "workers", "development"
+    batch_size: int = 100       # максимум user_ids в одном вызове notification_sender
+
+
+@lru_cache(maxsize=1)
+def _detect_environment_cached() -> NotificationConfig:
+    """
+    Автоматическое определение окружения
+    
+    Окружение не меняется во время работы процесса, поэтому проверка
+    выполняется один раз. Результат не изменять - берите копию через replace().
+    """
+    
+    # Проверяем переменные окружения Cloudflare Workers
+    is_workers = (
+        os.getenv('CF_WORKER') == 'true' or
+        os.getenv('CLOUDFLARE_WORKER') == 'true' or
+        'cloudflare' in os.getenv('ENVIRONMENT', '').lower() or
+        os.getenv('WORKERS_MODE') == 'true'
+    )
+    
+    # Проверяем наличие threading
+    try:
+        import threading
+        has_threading = True
+    except ImportError:
+        has_threading = False
+    
+    if is_workers or not has_threading:
+        environment = "workers"
+        workers_mode = True
+        logger.info("🌍 Обнаружено окружение Cloudflare Workers")
+    else:
+        environment = "local"
+        workers_mode = False
+        logger.info("🖥️ Обнаружено локальное окружение")
+    
+    return NotificationConfig(
+        workers_mode=workers_mode,
+        fallback_to_local=not is_workers,
+        environment=environment
+    )
 
 
 class NotificationAdapter:
@@ -50,46 +94,27 @@ class NotificationAdapter:
         """
         self.user_loader = user_loader
         self.notification_sender = notification_sender
+        self._sender = notification_sender
+        self._sender_is_async = asyncio.iscoroutinefunction(notification_sender)
         self.config = config or self._detect_environment()
         self.scheduler = None
         
+        # Возможности планировщика (заполняются в _initialize_scheduler)
+        self._has_start = False
+        self._has_stop = False
+        self._has_reload = False
+        self._has_execute = False
+        self._has_save_workers_config = False
+        self._has_workers_mode = False
+        
         logger.info(f"🔍 Определено окружение: {self.config.environment} (workers_mode: {self.config.workers_mode})")
         self._initialize_scheduler()
         
         logger.info(f"🔧 NotificationAdapter инициализирован (режим: {self.config.environment})")
     
     def _detect_environment(self) -> NotificationConfig:
-        """Автоматическое определение окружения"""
-        
-        # Проверяем переменные окружения Cloudflare Workers
-        is_workers = (
-            os.getenv('CF_WORKER') == 'true' or
-            os.getenv('CLOUDFLARE_WORKER') == 'true' or
-            'cloudflare' in os.getenv('ENVIRONMENT', '').lower() or
-            os.getenv('WORKERS_MODE') == 'true'
-        )
-        
-        # Проверяем наличие threading
-        try:
-            import threading
-            has_threading = True
-        except ImportError:
-            has_threading = False
-        
-        if is_workers or not has_threading:
-            environment = "workers"
-            workers_mode = True
-            logger.info("🌍 Обнаружено окружение Cloudflare Workers")
-        else:
-            environment = "local"
-            workers_mode = False
-            logger.info("🖥️ Обнаружено локальное окружение")
-        
-        return NotificationConfig(
-            workers_mode=workers_mode,
-            fallback_to_local=not is_workers,
-            environment=environment
-        )
+        """Автоматическое определение окружения (копия закэшированного результата)"""
+        return replace(_detect_environment_cached())
     
     def _initialize_scheduler(self):
         """Инициализирует подходящий планировщик"""
@@ -110,7 +135,8 @@ class NotificationAdapter:
                     from notification_scheduler_v2 import NotificationSchedulerV2
                     self.scheduler = NotificationSchedulerV2(
                         user_loader=self.user_loader,
-                        notification_sender=self.notification_sender
+                        notification_sender=self.notification_sender,
+                        batch_size=self.config.batch_size
                     )
                     logger.info("✅ Инициализирован локальный планировщик V2")
                     
@@ -127,6 +153,14 @@ class NotificationAdapter:
                         logger.info("✅ Fallback к Workers-планировщику")
                     else:
                         raise
+            
+            # Проверяем возможности планировщика один раз, а не при каждом вызове
+            self._has_start = hasattr(self.scheduler, 'start_scheduler')
+            self._has_stop = hasattr(self.scheduler, 'stop_scheduler')
+            self._has_reload = hasattr(self.scheduler, 'reload_scheduler')
+            self._has_execute = hasattr(self.scheduler, 'execute_notification')
+            self._has_save_workers_config = hasattr(self.scheduler, 'save_workers_config')
+            self._has_workers_mode = hasattr(self.scheduler, 'workers_mode')
         
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации планировщика: {e}")
@@ -142,7 +176,7 @@ class NotificationAdapter:
             self.scheduler.schedule_notifications()
             
             # Для Workers режима генерируем конфигурацию
-            if self.config.workers_mode and hasattr(self.scheduler, 'save_workers_config'):
+            if self.config.workers_mode and self._has_save_workers_config:
                 config_path = self.scheduler.save_workers_config()
                 logger.info(f"💾 Конфигурация Workers сохранена: {config_path}")
             
@@ -159,7 +193,7 @@ class NotificationAdapter:
             return False
         
         try:
-            if hasattr(self.scheduler, 'start_scheduler'):
+            if self._has_start:
                 self.scheduler.start_scheduler()
             else:
                 # Для Workers планировщика просто настраиваем
@@ -178,7 +212,7 @@ class NotificationAdapter:
             return True
         
         try:
-            if hasattr(self.scheduler, 'stop_scheduler'):
+            if self._has_stop:
                 self.scheduler.stop_scheduler()
             
             logger.info("⏹️ Планировщик уведомлений остановлен")
@@ -195,7 +229,7 @@ class NotificationAdapter:
             return False
         
         try:
-            if hasattr(self.scheduler, 'reload_scheduler'):
+            if self._has_reload:
                 self.scheduler.reload_scheduler()
             else:
                 # Для Workers планировщика пересоздаем конфигурацию
@@ -221,16 +255,17 @@ class NotificationAdapter:
             return False
         
         try:
-            if notification_id and hasattr(self.scheduler, 'execute_notification'):
+            if notification_id and self._has_execute:
                 # Workers режим - выполняем по ID
                 return await self.scheduler.execute_notification(notification_id)
             
             elif user_ids:
-                # Прямой вызов отправки
-                if asyncio.iscoroutinefunction(self.notification_sender):
-                    await self.notification_sender(user_ids)
-                else:
-                    self.notification_sender(user_ids)
+                # Прямой вызов отправки батчами по config.batch_size
+                for batch in chunked(user_ids, self.config.batch_size):
+                    if self._sender_is_async:
+                        await self._sender(batch)
+                    else:
+                        self._sender(batch)
                 return True
             
             else:
@@ -272,7 +307,7 @@ class NotificationAdapter:
     
     def is_workers_compatible(self) -> bool:
         """Проверяет совместимость с Cloudflare Workers"""
-        return self.config.workers_mode or hasattr(self.scheduler, 'workers_mode')
+        return self.config.workers_mode or self._has_workers_mode
 
 
 # Функция-фабрика для создания адаптера
@@ -1,19 +1,62 @@
 #!/usr/bin/env python3
 """
 ОБНОВЛЕННЫЙ МОДУЛЬ УВЕДОМЛЕНИЙ С НАДЕЖНЫМ ПЛАНИРОВЩИКОМ
-Заменяет ненадежную библиотеку schedule на threading.Timer
+Заменяет ненадежную библиотеку schedule на таймеры asyncio event loop (loop.call_at)
 """
 
+from __future__ import annotations
+
+import asyncio
+import operator
 import threading
 import time
-import pytz
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Callable, Tuple
 from dataclasses import dataclass
 from loguru import logger
 
+from common_utils import chunked, get_tz
+
+
+# Статусы, которым отправляются уведомления
+_ACTIVE_STATUSES = frozenset({'trial', 'pro'})
 
-@dataclass
+
+@lru_cache(maxsize=None)
+def _get_fixed_offset(name: str) -> Optional[Tuple[date, int]]:
+    """
+    Для зон без перехода на летнее время возвращает (дата начала, смещение в минутах)
+    
+    Такие зоны (Asia/Almaty, Asia/Tashkent и т.п.) конвертируются целочисленной
+    арифметикой без localize(). Для зон с переходами впереди возвращает None.
+    """
+    tz = get_tz(name)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    
+    # У pytz-зон с историей смещений есть таблица переходов (в UTC)
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if transitions and transitions[-1] > now:
+        return None
+    
+    # Смещение постоянно со дня после последнего перехода (запас на разницу дат UTC/локальной)
+    since = transitions[-1].date() + timedelta(days=1) if transitions else date.min
+    return since, int(tz.utcoffset(now).total_seconds()) // 60
+
+
+def _format_local_info(local_info: List[Tuple[str, str]]) -> str:
+    """Собирает строку локальных времен для логов из пар (время, зона)"""
+    return ", ".join(f"{local_time} {tz}" for local_time, tz in local_info)
+
+
+def _format_utc(timestamp: float, fmt: str) -> str:
+    """Форматирует epoch-время как UTC строку (только для логов и статуса)"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(fmt)
+
+
+@dataclass(slots=True)
 class NotificationUser:
     """Пользователь для системы уведомлений"""
     telegram_id: str
@@ -23,13 +66,13 @@ class NotificationUser:
     status: str           # "trial", "pro", "expired"
 
 
-@dataclass
+@dataclass(slots=True)
 class TimerTask:
     """Задача для выполнения по таймеру"""
-    target_time: datetime  # Точное время выполнения в UTC
+    target_time: float     # Точное время выполнения (epoch секунды, UTC)
     user_ids: List[str]    # ID пользователей для уведомления
-    local_info: str        # Информация о локальном времени для логов
-    timer: threading.Timer # Сам таймер
+    local_info: List[Tuple[str, str]]  # Пары (время, зона) для логов
+    timer: Optional[asyncio.TimerHandle] = None  # Таймер в event loop (ставится в потоке loop)
 
 
 class NotificationSchedulerV2:
@@ -37,7 +80,7 @@ class NotificationSchedulerV2:
     Обновленная система планирования уведомлений с надежным таймером
     
     Основные улучшения:
-    1. Заменен ненадежный schedule на threading.Timer
+    1. Заменен ненадежный schedule на таймеры одного asyncio event loop
     2. Точное выполнение задач в секунду
     3. Подробное логирование всех операций
     4. Автоматическое планирование на следующий день
@@ -45,21 +88,66 @@ class NotificationSchedulerV2:
     
     def __init__(self, 
                  user_loader: Callable[[], List[NotificationUser]],
-                 notification_sender: Callable[[List[str]], None]):
+                 notification_sender: Callable[[List[str]], None],
+                 max_workers: int = 8,
+                 batch_size: int = 100):
         """
         Инициализация надежного планировщика
         
         Args:
             user_loader: Функция для загрузки пользователей из БД
             notification_sender: Функция для отправки уведомлений
+            max_workers: Размер пула потоков для синхронного notification_sender
+            batch_size: Максимум user_ids в одном вызове notification_sender
         """
         self.user_loader = user_loader
         self.notification_sender = notification_sender
+        self._sender_is_async = asyncio.iscoroutinefunction(notification_sender)
+        self.batch_size = batch_size
         self.active_tasks: Dict[str, TimerTask] = {}
         self.is_running = False
         
+        # Состав групп с прошлого планирования (UTC время -> user_ids) и их задачи -
+        # при перезагрузке перепланируются только изменившиеся группы
+        self._prev_groups: Dict[str, frozenset] = {}
+        self._group_task_ids: Dict[str, str] = {}
+        self._task_seq = 0
+        
+        # Блокировка для active_tasks и состава групп (меняются из разных потоков)
+        self._lock = threading.Lock()
+        
+        # Фоновый event loop: держит таймеры задач (loop.call_at) и выполняет асинхронную отправку
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._ensure_loop()
+        
+        # Пул потоков для синхронного notification_sender (ограничивает параллельные отправки)
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
         logger.info("🔧 NotificationSchedulerV2 инициализирован (надежная версия)")
     
+    def _ensure_loop(self):
+        """Запускает фоновый event loop, если он еще не работает (или был остановлен)"""
+        if self._loop_thread is not None and self._loop_thread.is_alive():
+            return
+        
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="NotificationSchedulerLoop", daemon=True)
+        self._loop_thread.start()
+    
+    def _shutdown_loop(self):
+        """Останавливает фоновый event loop и дожидается завершения его потока"""
+        if self._loop_thread is None or not self._loop_thread.is_alive():
+            return
+        
+        # stop встает в очередь после уже поставленных отмен таймеров
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join(timeout=5)
+        if not self._loop_thread.is_alive():
+            self._loop.close()
+        self._loop_thread = None
+    
     def load_users(self) -> List[NotificationUser]:
         """Загружает список пользователей с настройками уведомлений"""
         try:
@@ -70,36 +158,40 @@ class NotificationSchedulerV2:
             logger.error(f"❌ Ошибка загрузки пользователей: {e}")
             return []
     
-    def convert_to_utc(self, local_time: str, timezone_str: str) -> Optional[str]:
+    def convert_to_utc(self, local_time: str, timezone_str: str, today: Optional[date] = None) -> Optional[str]:
         """
         Конвертирует локальное время в UTC
         
         Args:
             local_time: Время в формате "HH:MM"
             timezone_str: Временная зона (например, "Asia/Almaty")
+            today: Дата для конвертации (по умолчанию - сегодня)
             
         Returns:
             UTC время в формате "HH:MM" или None при ошибке
         """
+        import pytz  # Ленивый импорт: база tzdata грузится только при использовании
+        
         try:
             # Парсим локальное время
             local_dt = datetime.strptime(local_time, "%H:%M").time()
             
-            # Создаем timezone объект
-            user_tz = pytz.timezone(timezone_str)
-            
             # Берем сегодняшнюю дату
-            today = datetime.now().date()
-            
-            # Создаем datetime в локальной зоне
-            naive_dt = datetime.combine(today, local_dt)
-            local_dt_tz = user_tz.localize(naive_dt)
+            if today is None:
+                today = datetime.now().date()
             
-            # Конвертируем в UTC
-            utc_dt = local_dt_tz.astimezone(pytz.UTC)
-            utc_time_str = utc_dt.strftime("%H:%M")
+            fixed = _get_fixed_offset(timezone_str)
+            if fixed is not None and today >= fixed[0]:
+                # Зона без DST - достаточно вычесть смещение в минутах
+                minutes = (local_dt.hour * 60 + local_dt.minute - fixed[1]) % 1440
+                utc_time_str = f"{minutes // 60:02d}:{minutes % 60:02d}"
+            else:
+                # Зона с DST - полная конвертация через pytz
+                user_tz = get_tz(timezone_str)
+                local_dt_tz = user_tz.localize(datetime.combine(today, local_dt))
+                utc_time_str = local_dt_tz.astimezone(pytz.UTC).strftime("%H:%M")
             
-            logger.debug(f"🔄 {local_time} {timezone_str} -> {utc_time_str} UTC")
+            logger.debug("🔄 {} {} -> {} UTC", local_time, timezone_str, utc_time_str)
             return utc_time_str
             
         except Exception as e:
@@ -114,171 +206,213 @@ class NotificationSchedulerV2:
             utc_time: Время UTC в формате "HH:MM"
             
         Returns:
-            (delay_seconds, target_datetime) или (None, None) при ошибке
+            (delay_seconds, target_timestamp) или (None, None) при ошибке
         """
         try:
-            # Парсим время
-            target_time = datetime.strptime(utc_time, "%H:%M").time()
+            # Парсим время (дешевле strptime)
+            hours, minutes = map(int, utc_time.split(":"))
+            if not (0 <= hours < 24 and 0 <= minutes < 60):
+                raise ValueError(f"некорректное время {utc_time}")
             
-            # Получаем текущее время UTC
-            now_utc = datetime.now(pytz.UTC)
-            
-            # Создаем target datetime на сегодня
-            target_datetime = datetime.combine(now_utc.date(), target_time)
-            target_datetime = pytz.UTC.localize(target_datetime)
+            # Цель на сегодня в epoch секундах от полуночи UTC
+            now = time.time()
+            today_midnight_utc = now - now % 86400
+            target = today_midnight_utc + hours * 3600 + minutes * 60
             
             # Если время уже прошло, планируем на завтра
-            if target_datetime <= now_utc:
-                target_datetime += timedelta(days=1)
+            if target <= now:
+                target += 86400
                 logger.info(f"⏭️ Время {utc_time} UTC уже прошло, планируем на завтра")
             
             # Рассчитываем задержку
-            delay = (target_datetime - now_utc).total_seconds()
+            delay = target - now
             
-            logger.info(f"⏰ Планируем выполнение через {delay:.1f} сек ({target_datetime.strftime('%Y-%m-%d %H:%M:%S')} UTC)")
+            logger.info(f"⏰ Планируем выполнение через {delay:.1f} сек ({_format_utc(target, '%Y-%m-%d %H:%M:%S')} UTC)")
             
-            return delay, target_datetime
+            return delay, target
             
         except Exception as e:
             logger.error(f"❌ Ошибка расчета задержки для {utc_time}: {e}")
             return None, None
     
-    def create_notification_task(self, user_ids: List[str], local_info: str, task_id: str):
+    def create_notification_task(self, user_ids: List[str], local_info: List[Tuple[str, str]], task_id: str):
         """Создает функцию задачи для выполнения по таймеру"""
-        def execute_notification():
-            logger.info(f"🎯 ВЫПОЛНЕНИЕ уведомлений (task_id: {task_id})")
-            logger.info(f"📤 Отправляем {len(user_ids)} пользователям")
-            logger.info(f"🌍 Локальная информация: {local_info}")
-            
+        def on_sent(future, batch_size: int):
             try:
-                # Отправляем уведомления
-                self.notification_sender(user_ids)
-                logger.info(f"✅ Уведомления отправлены успешно (task_id: {task_id})")
+                future.result()
+                logger.info(f"✅ Уведомления отправлены успешно (task_id: {task_id}, батч: {batch_size})")
                 
             except Exception as e:
-                logger.error(f"❌ Ошибка отправки уведомлений (task_id: {task_id}): {e}")
+                logger.error(f"❌ Ошибка отправки уведомлений (task_id: {task_id}, батч: {batch_size}): {e}")
+        
+        def execute_notification():
+            # Задача сработала - убираем ее из активных (отмененную при перезагрузке пропускаем)
+            with self._lock:
+                task = self.active_tasks.pop(task_id, None)
+            if task is None:
+                logger.info(f"⏭️ Задача {task_id} была отменена, пропускаем")
+                return
+            
+            logger.debug("🗑️ Задача {} удалена из активных", task_id)
+            
+            # Таймер мог сработать до запуска или после остановки планировщика -
+            # задача уже снята и не висит в get_status, следующая перезагрузка поставит ее заново
+            if not self.is_running:
+                logger.warning(f"⚠️ Планировщик не запущен, задача {task_id} пропущена")
+                return
             
-            finally:
-                # Удаляем выполненную задачу из активных
-                if task_id in self.active_tasks:
-                    del self.active_tasks[task_id]
-                    logger.debug(f"🗑️ Задача {task_id} удалена из активных")
+            logger.info(f"🎯 ВЫПОЛНЕНИЕ уведомлений (task_id: {task_id})")
+            logger.info(f"📤 Отправляем {len(user_ids)} пользователям")
+            logger.opt(lazy=True).info("🌍 Локальная информация: {}", lambda: _format_local_info(local_info))
+            
+            # Только ставим отправку батчей в очередь - event loop не ждет сеть.
+            # Колбэк выполняется в потоке loop, поэтому корутины создаются в нем напрямую
+            for batch in chunked(user_ids, self.batch_size):
+                if self._sender_is_async:
+                    future = self._loop.create_task(self.notification_sender(batch))
+                else:
+                    future = self._executor.submit(self.notification_sender, batch)
+                future.add_done_callback(lambda f, n=len(batch): on_sent(f, n))
         
         return execute_notification
     
+    def _arm_timer(self, task: TimerTask, delay: float, task_function: Callable):
+        """Ставит таймер задачи в event loop (выполняется в потоке loop)"""
+        # Срок считается по часам самого loop - они не обязаны совпадать с time.monotonic()
+        task.timer = self._loop.call_at(self._loop.time() + delay, task_function)
+    
+    @staticmethod
+    def _cancel_timers(tasks: Tuple[TimerTask, ...]):
+        """Отменяет таймеры задач (выполняется в потоке loop)"""
+        for task in tasks:
+            if task.timer is not None:
+                task.timer.cancel()
+    
     def schedule_notifications(self):
         """Настраивает планировщик на основе текущих пользователей"""
         try:
             logger.info("🔄 Настройка надежного планировщика уведомлений...")
             
-            # Очищаем старые задачи
-            self.clear_all_tasks()
+            # Таймеры ставятся в фоновый loop - поднимаем его, если планировщик останавливали
+            self._ensure_loop()
             
             # Загружаем пользователей
             users = self.load_users()
             if not users:
                 logger.warning("⚠️ Нет пользователей для планирования")
+                self.clear_all_tasks()
                 return
             
-            # Группируем пользователей по UTC времени
-            utc_groups = {}
+            # Группируем пользователей по UTC времени: utc_time -> (user_ids, local_info)
+            utc_groups = defaultdict(lambda: ([], []))
+            today = datetime.now().date()  # Общая дата для всех пользователей
             
-            for user in users:
-                # Пропускаем отключенные уведомления
-                if user.notification_time == "disabled":
-                    logger.debug(f"⏸️ Пользователь {user.username} отключил уведомления")
-                    continue
-                
-                # Пропускаем неактивных пользователей
-                if user.status not in ['trial', 'pro']:
-                    logger.debug(f"⏸️ Пользователь {user.username} неактивен ({user.status})")
-                    continue
-                
-                # Конвертируем время в UTC
-                utc_time = self.convert_to_utc(user.notification_time, user.timezone)
+            # Пропускаем отключенные уведомления и неактивных пользователей за один проход
+            active_users = [
+                user for user in users
+                if user.notification_time != "disabled" and user.status in _ACTIVE_STATUSES
+            ]
+            logger.debug("⏸️ Пропущено {} пользователей (уведомления отключены или неактивны)", len(users) - len(active_users))
+            
+            # Конвертируем в UTC каждую уникальную пару (время, зона) один раз
+            pairs = {(user.notification_time, user.timezone) for user in active_users}
+            utc_map = {pair: self.convert_to_utc(*pair, today) for pair in pairs}
+            
+            for user in active_users:
+                utc_time = utc_map[(user.notification_time, user.timezone)]
                 if not utc_time:
                     continue
                 
                 # Группируем по UTC времени
-                if utc_time not in utc_groups:
-                    utc_groups[utc_time] = {
-                        "user_ids": [],
-                        "local_info": []
-                    }
+                ids, infos = utc_groups[utc_time]
+                ids.append(user.telegram_id)
+                infos.append((user.notification_time, user.timezone))
                 
-                utc_groups[utc_time]["user_ids"].append(user.telegram_id)
-                utc_groups[utc_time]["local_info"].append(f"{user.notification_time} {user.timezone}")
-                
-                logger.debug(f"👤 {user.username}: {user.notification_time} {user.timezone} -> {utc_time} UTC")
+                logger.debug("👤 {}: {} {} -> {} UTC", user.username, user.notification_time, user.timezone, utc_time)
+            
+            new_groups = {utc_time: frozenset(ids) for utc_time, (ids, _) in utc_groups.items()}
+            
+            # Снимаем задачи групп, которые исчезли или изменили состав
+            cancelled = []
+            with self._lock:
+                for utc_time, task_id in list(self._group_task_ids.items()):
+                    unchanged = (
+                        new_groups.get(utc_time) == self._prev_groups.get(utc_time)
+                        and task_id in self.active_tasks
+                    )
+                    if not unchanged:
+                        task = self.active_tasks.pop(task_id, None)
+                        if task is not None:
+                            cancelled.append(task)
+                        del self._group_task_ids[utc_time]
+            if cancelled:
+                self._loop.call_soon_threadsafe(self._cancel_timers, tuple(cancelled))
             
-            # Создаем таймеры для каждой группы
-            current_utc = datetime.now(pytz.UTC)
+            # Создаем таймеры для новых и изменившихся групп
+            current_hhmm = datetime.now(timezone.utc).strftime("%H:%M")
             scheduled_count = 0
             
-            for utc_time, group_data in utc_groups.items():
+            for utc_time, (user_ids, local_info) in utc_groups.items():
+                if utc_time in self._group_task_ids:
+                    continue  # Состав группы не изменился - задача остается как есть
+                
                 # Рассчитываем задержку
-                delay, target_datetime = self.calculate_delay_to_time(utc_time)
+                delay, target_ts = self.calculate_delay_to_time(utc_time)
                 
                 if delay is None:
                     logger.error(f"❌ Не удалось запланировать группу {utc_time}")
                     continue
                 
-                # Информация для логов
-                local_info_str = ", ".join(group_data["local_info"])
-                user_ids = group_data["user_ids"]
-                
                 # Создаем уникальный ID задачи
-                task_id = f"{utc_time}_{len(self.active_tasks)}"
+                task_id = f"{utc_time}_{self._task_seq}"
+                self._task_seq += 1
                 
                 # Создаем функцию задачи
-                task_function = self.create_notification_task(user_ids, local_info_str, task_id)
-                
-                # Создаем таймер
-                timer = threading.Timer(delay, task_function)
-                timer.daemon = True  # Daemon timer завершится с основным процессом
+                task_function = self.create_notification_task(user_ids, local_info, task_id)
                 
                 # Создаем объект задачи
                 task = TimerTask(
-                    target_time=target_datetime,
+                    target_time=target_ts,
                     user_ids=user_ids,
-                    local_info=local_info_str,
-                    timer=timer
+                    local_info=local_info
                 )
                 
-                # Сохраняем задачу
-                self.active_tasks[task_id] = task
-                
-                # Запускаем таймер
-                timer.start()
+                # Сохраняем задачу и ставим таймер в event loop
+                with self._lock:
+                    self.active_tasks[task_id] = task
+                    self._group_task_ids[utc_time] = task_id
+                self._loop.call_soon_threadsafe(self._arm_timer, task, delay, task_function)
                 scheduled_count += 1
                 
                 # Логируем статус
-                utc_dt = datetime.strptime(utc_time, "%H:%M").time()
-                current_time = current_utc.time()
-                
-                if utc_dt > current_time:
+                if utc_time > current_hhmm:
                     status = "🟢 БУДУЩЕЕ"
                 else:
                     status = "🔴 ПРОШЕДШЕЕ (завтра)"
                 
                 logger.info(f"⏰ {utc_time} UTC - {len(user_ids)} пользователей {status}")
-                logger.debug(f"   Локальные времена: {local_info_str}")
-                logger.info(f"🔧 Таймер {task_id} запущен (выполнится в {target_datetime.strftime('%H:%M:%S')})")
+                logger.opt(lazy=True).debug("   Локальные времена: {}", lambda: _format_local_info(local_info))
+                logger.info(f"🔧 Задача {task_id} запланирована (выполнится в {_format_utc(target_ts, '%H:%M:%S')})")
+            
+            self._prev_groups = new_groups
             
-            logger.info(f"🎯 Настроено {scheduled_count} надежных таймеров")
+            logger.info(f"🎯 Настроено {scheduled_count} надежных таймеров (без изменений: {len(self._group_task_ids) - scheduled_count})")
             
         except Exception as e:
             logger.error(f"❌ Ошибка настройки планировщика: {e}")
     
     def clear_all_tasks(self):
         """Очищает все активные задачи"""
-        logger.info(f"🧹 Очищаем {len(self.active_tasks)} активных задач")
+        # Снимаем все задачи разом под блокировкой, таймеры отменяются одним вызовом в loop
+        with self._lock:
+            tasks = tuple(self.active_tasks.values())
+            self.active_tasks.clear()
+            self._group_task_ids.clear()
+            self._prev_groups = {}
         
-        for task_id, task in self.active_tasks.items():
-            task.timer.cancel()
-            logger.debug(f"❌ Таймер {task_id} отменен")
-        
-        self.active_tasks.clear()
+        if tasks and self._loop_thread is not None and self._loop_thread.is_alive():
+            self._loop.call_soon_threadsafe(self._cancel_timers, tasks)
+        logger.info(f"🧹 Отменено {len(tasks)} активных задач")
     
     def start_scheduler(self):
         """Запускает планировщик"""
@@ -289,7 +423,8 @@ class NotificationSchedulerV2:
         # Настраиваем планировщик
         self.schedule_notifications()
         
-        # Отмечаем как запущенный
+        # Отмечаем как запущенный - таймеры уже стоят в event loop
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="NotificationSender")
         self.is_running = True
         
         logger.info("🚀 Надежный планировщик уведомлений запущен")
@@ -298,6 +433,11 @@ class NotificationSchedulerV2:
         """Останавливает планировщик"""
         self.is_running = False
         self.clear_all_tasks()
+        self._shutdown_loop()
+        
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
         logger.info("⏹️ Планировщик уведомлений остановлен")
     
     def reload_scheduler(self):
@@ -308,38 +448,50 @@ class NotificationSchedulerV2:
     
     def get_status(self) -> Dict:
         """Возвращает текущий статус планировщика"""
-        now_utc = datetime.now(pytz.UTC)
+        now = time.time()
+        
+        # Снимок под блокировкой - таймеры удаляют задачи из потока loop
+        with self._lock:
+            snapshot = list(self.active_tasks.items())
+        
+        # Сортируем по числовому времени выполнения, строки форматируем уже после
+        upcoming = sorted(
+            (item for item in snapshot if item[1].target_time > now),
+            key=lambda item: item[1].target_time
+        )
         
         active_tasks = []
-        for task_id, task in self.active_tasks.items():
-            if task.target_time > now_utc:
-                remaining = (task.target_time - now_utc).total_seconds()
-                active_tasks.append({
-                    "task_id": task_id,
-                    "target_time": task.target_time.strftime("%Y-%m-%d %H:%M:%S UTC"),
-                    "remaining_seconds": int(remaining),
-                    "user_count": len(task.user_ids),
-                    "local_info": task.local_info
-                })
+        for task_id, task in upcoming:
+            active_tasks.append({
+                "task_id": task_id,
+                "target_time": _format_utc(task.target_time, "%Y-%m-%d %H:%M:%S UTC"),
+                "remaining_seconds": int(task.target_time - now),
+                "user_count": len(task.user_ids),
+                "local_info": _format_local_info(task.local_info)
+            })
         
         return {
             "is_running": self.is_running,
-            "active_tasks": len(self.active_tasks),
+            "active_tasks": len(snapshot),
             "upcoming_tasks": len(active_tasks),
-            "current_utc_time": now_utc.strftime("%H:%M:%S"),
+            "current_utc_time": _format_utc(now, "%H:%M:%S"),
             "tasks": active_tasks
         }
     
     def get_next_notifications(self) -> List[Dict]:
         """Возвращает список ближайших уведомлений"""
-        notifications = []
+        # Снимок под блокировкой - таймеры удаляют задачи из потока loop
+        with self._lock:
+            snapshot = list(self.active_tasks.items())
         
-        for task_id, task in self.active_tasks.items():
-            notifications.append({
-                "next_run": task.target_time.strftime("%Y-%m-%d %H:%M:%S UTC"),
-                "task_info": f"Task {task_id}: {len(task.user_ids)} users"
-            })
+        # Сортируем по времени выполнения (float), а не по отформатированной строке
+        tasks = [(task.target_time, task_id, task) for task_id, task in snapshot]
+        tasks.sort(key=operator.itemgetter(0))
         
-        # Сортируем по времени выполнения
-        notifications.sort(key=lambda x: x["next_run"])
-        return notifications
\ No newline at end of file
+        return [
+            {
+                "next_run": _format_utc(target_time, "%Y-%m-%d %H:%M:%S UTC"),
+                "task_info": f"Task {task_id}: {len(task.user_ids)} users"
+            }
+            for target_time, task_id, task in tasks
+        ]
\ No newline at end of file
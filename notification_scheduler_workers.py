@@ -7,13 +7,22 @@ CLOUDFLARE WORKERS СОВМЕСТИМЫЙ ПЛАНИРОВЩИК УВЕДОМЛ
 import pytz
 import json
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Callable, Tuple
 from dataclasses import dataclass, asdict
 from loguru import logger
 
+from common_utils import chunked, get_tz, orjson
 
-@dataclass
+_UTC = pytz.UTC
+
+# Размер чанка user_ids для параллельной отправки (дружелюбно к лимитам Telegram API)
+SEND_CHUNK_SIZE = 25
+
+
+@dataclass(frozen=True, slots=True)
 class NotificationUser:
     """Пользователь для системы уведомлений"""
     telegram_id: str
@@ -23,7 +32,7 @@ class NotificationUser:
     status: str           # "trial", "pro", "expired"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ScheduledNotification:
     """Запланированное уведомление для Workers"""
     utc_time: str          # "HH:MM" время в UTC
@@ -31,6 +40,37 @@ class ScheduledNotification:
     local_info: str        # Информация о локальных временах
     cron_expression: str   # Cron выражение для Workers
     created_at: str        # Время создания
+    
+    @classmethod
+    def create(cls, utc_time: str, user_ids: List[str], local_info: str, created_at: str) -> "ScheduledNotification":
+        """Создает уведомление, выводя cron выражение из utc_time ("HH:MM" из strftime)"""
+        # Формат: минута час день месяц день_недели
+        return cls(utc_time, user_ids, local_info, f"{utc_time[3:5]} {utc_time[:2]} * * *", created_at)
+
+
+def _parse_hhmm(value: str) -> Tuple[int, int]:
+    """Разбирает "H:MM"/"HH:MM" (как strptime "%H:%M" в /settime) в (час, минута)"""
+    hour, minute = (int(part) for part in value.split(':'))
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"время вне диапазона: {value!r}")
+    return hour, minute
+
+
+@lru_cache(maxsize=4096)
+def _convert_to_utc_cached(local_time: str, timezone_str: str, today: date) -> str:
+    """Конвертирует локальное "HH:MM" в UTC "HH:MM" на дату today (ошибки не кэшируются)"""
+    # Парсим локальное время
+    local_dt = time(*_parse_hhmm(local_time))
+    
+    # Получаем timezone объект (из кэша)
+    user_tz = get_tz(timezone_str)
+    
+    # Создаем datetime в локальной зоне и конвертируем в UTC
+    local_dt_tz = user_tz.localize(datetime.combine(today, local_dt))
+    utc_time_str = local_dt_tz.astimezone(_UTC).strftime("%H:%M")
+    
+    logger.debug("🔄 {} {} -> {} UTC", local_time, timezone_str, utc_time_str)
+    return utc_time_str
 
 
 class NotificationSchedulerWorkers:
@@ -57,9 +97,13 @@ class NotificationSchedulerWorkers:
         """
         self.user_loader = user_loader
         self.notification_sender = notification_sender
+        self._sender_is_async = asyncio.iscoroutinefunction(notification_sender)
         self.workers_mode = workers_mode
         self.scheduled_notifications: Dict[str, ScheduledNotification] = {}
         
+        # Снимок уведомлений для get_status (сбрасывается при изменении scheduled_notifications)
+        self._status_cache: Optional[List[Dict]] = None
+        
         logger.info(f"🌍 NotificationSchedulerWorkers инициализирован (workers_mode: {workers_mode})")
     
     def load_users(self) -> List[NotificationUser]:
@@ -72,37 +116,25 @@ class NotificationSchedulerWorkers:
             logger.error(f"❌ Ошибка загрузки пользователей: {e}")
             return []
     
-    def convert_to_utc(self, local_time: str, timezone_str: str) -> Optional[str]:
+    def convert_to_utc(self, local_time: str, timezone_str: str, today: Optional[date] = None) -> Optional[str]:
         """
         Конвертирует локальное время в UTC
         
         Args:
             local_time: Время в формате "HH:MM"
             timezone_str: Временная зона
+            today: Дата для конвертации (по умолчанию - сегодня)
             
         Returns:
             UTC время в формате "HH:MM" или None при ошибке
         """
-        try:
-            # Парсим локальное время
-            local_dt = datetime.strptime(local_time, "%H:%M").time()
-            
-            # Создаем timezone объект
-            user_tz = pytz.timezone(timezone_str)
-            
-            # Берем сегодняшнюю дату
+        # Берем сегодняшнюю дату
+        if today is None:
             today = datetime.now().date()
-            
-            # Создаем datetime в локальной зоне
-            naive_dt = datetime.combine(today, local_dt)
-            local_dt_tz = user_tz.localize(naive_dt)
-            
-            # Конвертируем в UTC
-            utc_dt = local_dt_tz.astimezone(pytz.UTC)
-            utc_time_str = utc_dt.strftime("%H:%M")
-            
-            logger.debug(f"🔄 {local_time} {timezone_str} -> {utc_time_str} UTC")
-            return utc_time_str
+        
+        try:
+            # Дата входит в ключ кэша - на следующий день (смена DST) пересчитается
+            return _convert_to_utc_cached(local_time, timezone_str, today)
             
         except Exception as e:
             logger.error(f"❌ Ошибка конвертации времени {local_time} {timezone_str}: {e}")
@@ -119,10 +151,10 @@ class NotificationSchedulerWorkers:
             Cron expression (например, "15 20 * * *" для 20:15)
         """
         try:
-            hour, minute = utc_time.split(":")
+            hour, minute = _parse_hhmm(utc_time)
             # Формат: минута час день месяц день_недели
-            cron_expr = f"{minute} {hour} * * *"
-            logger.debug(f"🕐 {utc_time} UTC -> cron: {cron_expr}")
+            cron_expr = f"{minute:02d} {hour:02d} * * *"
+            logger.debug("🕐 {} UTC -> cron: {}", utc_time, cron_expr)
             return cron_expr
             
         except Exception as e:
@@ -151,8 +183,8 @@ class NotificationSchedulerWorkers:
             }
             workers_config["cron_triggers"].append(cron_trigger)
             
-            # Добавляем данные уведомления
-            workers_config["notifications"][notification_id] = asdict(notification)
+            # Добавляем данные уведомления (dataclass сериализуется при сохранении, без asdict)
+            workers_config["notifications"][notification_id] = notification
         
         logger.info(f"🔧 Сгенерирована конфигурация для {len(workers_config['cron_triggers'])} cron triggers")
         return workers_config
@@ -162,8 +194,13 @@ class NotificationSchedulerWorkers:
         try:
             config = self.generate_workers_config()
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            if orjson is not None:
+                # orjson сам обходит dataclass и пишет UTF-8 байты
+                with open(file_path, 'wb') as f:
+                    f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_DATACLASS))
+            else:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(config, f, indent=2, ensure_ascii=False, default=asdict)
             
             logger.info(f"💾 Конфигурация Workers сохранена: {file_path}")
             return file_path
@@ -179,6 +216,7 @@ class NotificationSchedulerWorkers:
             
             # Очищаем старые уведомления
             self.scheduled_notifications.clear()
+            self._status_cache = None
             
             # Загружаем пользователей
             users = self.load_users()
@@ -186,69 +224,70 @@ class NotificationSchedulerWorkers:
                 logger.warning("⚠️ Нет пользователей для планирования")
                 return
             
-            # Группируем пользователей по UTC времени
-            utc_groups = {}
+            # Группируем пользователей по UTC времени: utc_time -> (user_ids, local_info)
+            utc_groups = defaultdict(lambda: ([], []))
+            now = datetime.now()
+            today = now.date()  # Общая дата для всех пользователей
+            created_at = now.isoformat()  # Общее время создания для всех уведомлений прохода
             
+            # Собираем пользователей по уникальным парам (время, зона) за один проход
+            pairs: Dict[tuple, List[str]] = {}
             for user in users:
                 # Пропускаем отключенные уведомления
                 if user.notification_time == "disabled":
-                    logger.debug(f"⏸️ Пользователь {user.username} отключил уведомления")
+                    logger.debug("⏸️ Пользователь {} отключил уведомления", user.username)
                     continue
                 
                 # Пропускаем неактивных пользователей
                 if user.status not in ['trial', 'pro']:
-                    logger.debug(f"⏸️ Пользователь {user.username} неактивен ({user.status})")
+                    logger.debug("⏸️ Пользователь {} неактивен ({})", user.username, user.status)
                     continue
                 
-                # Конвертируем время в UTC
-                utc_time = self.convert_to_utc(user.notification_time, user.timezone)
+                pairs.setdefault((user.notification_time, user.timezone), []).append(user.telegram_id)
+            
+            # Конвертируем время в UTC один раз на пару
+            for (local_time, timezone_str), user_ids in pairs.items():
+                utc_time = self.convert_to_utc(local_time, timezone_str, today)
                 if not utc_time:
                     continue
                 
                 # Группируем по UTC времени
-                if utc_time not in utc_groups:
-                    utc_groups[utc_time] = {
-                        "user_ids": [],
-                        "local_info": []
-                    }
-                
-                utc_groups[utc_time]["user_ids"].append(user.telegram_id)
-                utc_groups[utc_time]["local_info"].append(f"{user.notification_time} {user.timezone}")
+                ids, infos = utc_groups[utc_time]
+                ids.extend(user_ids)
+                infos.extend([f"{local_time} {timezone_str}"] * len(user_ids))
                 
-                logger.debug(f"👤 {user.username}: {user.notification_time} {user.timezone} -> {utc_time} UTC")
+                logger.debug("👥 {} польз.: {} {} -> {} UTC", len(user_ids), local_time, timezone_str, utc_time)
             
             # Создаем запланированные уведомления
             notification_count = 0
             
-            for utc_time, group_data in utc_groups.items():
-                # Генерируем cron expression
-                cron_expr = self.time_to_cron(utc_time)
-                
+            for utc_time, (user_ids, local_info) in utc_groups.items():
                 # Информация для логов
-                local_info_str = ", ".join(group_data["local_info"])
-                user_ids = group_data["user_ids"]
+                local_info_str = ", ".join(local_info)
                 
                 # Создаем ID уведомления
                 notification_id = f"notification_{utc_time.replace(':', '_')}"
                 
                 # Создаем запланированное уведомление
-                scheduled_notification = ScheduledNotification(
+                scheduled_notification = ScheduledNotification.create(
                     utc_time=utc_time,
                     user_ids=user_ids,
                     local_info=local_info_str,
-                    cron_expression=cron_expr,
-                    created_at=datetime.now().isoformat()
+                    created_at=created_at
                 )
                 
                 # Сохраняем уведомление
                 self.scheduled_notifications[notification_id] = scheduled_notification
                 notification_count += 1
                 
-                logger.info(f"📅 {utc_time} UTC ({cron_expr}) - {len(user_ids)} пользователей")
-                logger.debug(f"   Локальные времена: {local_info_str}")
+                logger.info(f"📅 {utc_time} UTC ({scheduled_notification.cron_expression}) - {len(user_ids)} пользователей")
+                logger.debug("   Локальные времена: {}", local_info_str)
             
             logger.info(f"🎯 Настроено {notification_count} уведомлений для Workers")
             
+            # Готовим снимок для get_status один раз на проход планирования
+            self._status_cache = self._build_status_snapshot()
+            
             # Сохраняем конфигурацию Workers
             if self.workers_mode:
                 self.save_workers_config()
@@ -273,39 +312,61 @@ class NotificationSchedulerWorkers:
         logger.info(f"📤 Отправляем {len(notification.user_ids)} пользователям")
         logger.info(f"🌍 Локальная информация: {notification.local_info}")
         
-        try:
-            # Отправляем уведомления
-            if asyncio.iscoroutinefunction(self.notification_sender):
-                await self.notification_sender(notification.user_ids)
-            else:
-                self.notification_sender(notification.user_ids)
-            
-            logger.info(f"✅ Уведомления отправлены успешно: {notification_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки уведомлений {notification_id}: {e}")
+        chunks = list(chunked(notification.user_ids, SEND_CHUNK_SIZE))
+        if self._sender_is_async:
+            # Асинхронный отправитель - чанки идут параллельно, сетевые задержки перекрываются
+            results = await asyncio.gather(
+                *(self.notification_sender(chunk) for chunk in chunks),
+                return_exceptions=True
+            )
+        else:
+            # Этот планировщик выбирают там, где потоков нет - синхронный отправитель
+            # вызывается прямо здесь, чанк за чанком
+            results = []
+            for chunk in chunks:
+                try:
+                    results.append(self.notification_sender(chunk))
+                except Exception as e:
+                    results.append(e)
+        
+        failed = 0
+        for i, result in enumerate(results, start=1):
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"❌ Ошибка отправки уведомлений {notification_id} (чанк {i}/{len(chunks)}): {result}")
+        
+        if failed:
             return False
-    
-    def get_status(self) -> Dict:
-        """Возвращает текущий статус планировщика"""
-        now_utc = datetime.now(pytz.UTC)
         
-        scheduled_notifications = []
-        for notification_id, notification in self.scheduled_notifications.items():
-            scheduled_notifications.append({
+        logger.info(f"✅ Уведомления отправлены успешно: {notification_id}")
+        return True
+    
+    def _build_status_snapshot(self) -> List[Dict]:
+        """Собирает описание запланированных уведомлений для get_status"""
+        return [
+            {
                 "notification_id": notification_id,
                 "utc_time": notification.utc_time,
                 "cron_expression": notification.cron_expression,
                 "user_count": len(notification.user_ids),
                 "local_info": notification.local_info
-            })
+            }
+            for notification_id, notification in self.scheduled_notifications.items()
+        ]
+    
+    def get_status(self) -> Dict:
+        """Возвращает текущий статус планировщика"""
+        now_utc = datetime.now(_UTC)
+        
+        # Снимок пересобирается только если планирование прервалось до его построения
+        if self._status_cache is None:
+            self._status_cache = self._build_status_snapshot()
         
         return {
             "workers_mode": self.workers_mode,
             "scheduled_notifications": len(self.scheduled_notifications),
             "current_utc_time": now_utc.strftime("%H:%M:%S"),
-            "notifications": scheduled_notifications
+            "notifications": list(self._status_cache)
         }
     
     def get_workers_wrangler_config(self) -> str:
@@ -315,22 +376,23 @@ class NotificationSchedulerWorkers:
         Returns:
             Строка с конфигурацией wrangler.toml
         """
-        wrangler_config = """
+        parts = ["""
 # Cloudflare Workers конфигурация для EventGREEN Bot
 name = "eventgreen-notifications"
 compatibility_date = "2023-10-30"
 
 # Cron triggers для уведомлений
-"""
+"""]
         
-        for notification_id, notification in self.scheduled_notifications.items():
-            wrangler_config += f"""
+        # Собираем части в список и склеиваем один раз (без квадратичного +=)
+        for notification in self.scheduled_notifications.values():
+            parts.append(f"""
 [[triggers.crons]]
 cron = "{notification.cron_expression}"
 # {notification.local_info} -> {notification.utc_time} UTC
-"""
+""")
         
-        return wrangler_config.strip()
+        return "".join(parts).strip()
 
 
 # Вспомогательная функция для создания планировщика
@@ -5,8 +5,9 @@
 """
 
 import os
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional, Tuple
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
@@ -15,6 +16,27 @@ from dataclasses import dataclass
 
 load_dotenv()
 
+# Сколько секунд переиспользовать прочитанные строки мастер-таблицы
+ROWS_CACHE_TTL = 5.0
+
+def _row_available(row: list) -> bool:
+    """
+    Проверяет, свободна ли таблица в строке мастер-таблицы
+    
+    Таблица доступна если есть URL и:
+    1. telegram_id пустой или начинается с TABLE_
+    2. Или статус 'available'
+    """
+    n = len(row)
+    if n < 3 or not row[2].startswith('https://'):  # Нет URL таблицы
+        return False
+    telegram_id = row[0]
+    return (
+        not telegram_id or
+        telegram_id.startswith('TABLE_') or
+        (n > 3 and bool(row[3]) and row[3].lower() == 'available')
+    )
+
 @dataclass
 class AvailableTable:
     """Структура доступной таблицы"""
@@ -31,10 +53,21 @@ class TableAssignmentManager:
     def __init__(self, service_account_path: str = 'service.json'):
         self.service_account_path = service_account_path
         self.master_sheet_id = os.getenv('MASTER_SHEET_ID')
-        self._init_services()
+        self._cache: Optional[tuple] = None  # (monotonic время чтения, строки A:F)
+        self._sheets_service = None  # Создается при первом обращении к sheets_service
+    
+    @property
+    def sheets_service(self):
+        """Сервис Google Sheets (инициализируется лениво, при первом использовании)"""
+        if self._sheets_service is None:
+            self._init_services()
+        return self._sheets_service
     
     def _init_services(self):
-        """Инициализирует сервисы Google API"""
+        """Инициализирует сервисы Google API (повторный вызов ничего не делает)"""
+        if self._sheets_service is not None:
+            return
+        
         try:
             credentials = service_account.Credentials.from_service_account_file(
                 self.service_account_path,
@@ -44,63 +77,76 @@ class TableAssignmentManager:
                 ]
             )
             
-            self.sheets_service = build('sheets', 'v4', credentials=credentials)
+            # cache_discovery=False: документ discovery берется из пакета, без файлового кэша
+            self._sheets_service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
             print("✅ Google API сервисы инициализированы")
             
         except Exception as e:
             print(f"❌ Ошибка инициализации Google API: {e}")
             raise
     
-    def get_available_table(self) -> Optional[AvailableTable]:
+    def _fetch_rows(self, max_age: float = ROWS_CACHE_TTL) -> List[list]:
+        """
+        Читает строки A:F мастер-таблицы, переиспользуя недавний ответ
+        
+        Args:
+            max_age: Максимальный возраст кэша в секундах
+            
+        Returns:
+            Список строк (включая заголовок)
+        """
+        if self._cache is not None and time.monotonic() - self._cache[0] < max_age:
+            return self._cache[1]
+        
+        result = self.sheets_service.spreadsheets().values().get(
+            spreadsheetId=self.master_sheet_id,
+            range='A:F',
+            fields='values'  # Только значения, без метаданных ответа
+        ).execute()
+        
+        values = result.get('values', [])
+        self._cache = (time.monotonic(), values)
+        return values
+    
+    def get_available_table(self) -> Tuple[Optional[AvailableTable], Optional[int]]:
         """
         Находит первую доступную таблицу из пула
         
         Returns:
-            AvailableTable объект или None если нет доступных
+            (AvailableTable, номер строки) или (None, None) если нет доступных
         """
         try:
             if not self.master_sheet_id:
                 print("❌ MASTER_SHEET_ID не настроен")
-                return None
+                return None, None
             
-            # Читаем все данные из мастер-таблицы
-            result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=self.master_sheet_id,
-                range='A:F'
-            ).execute()
-            
-            values = result.get('values', [])
+            # Читаем все данные из мастер-таблицы заново: выбранная строка будет перезаписана,
+            # и по данным из кэша можно затереть строку, которую уже занял кто-то другой
+            values = self._fetch_rows(max_age=0)
             
             if not values:
                 print("❌ Мастер-таблица пуста")
-                return None
+                return None, None
             
-            # Ищем первую доступную таблицу (пустой telegram_id или TABLE_XX)
-            for i, row in enumerate(values[1:], start=2):  # Пропускаем заголовок
-                if len(row) >= 3 and row[2].startswith('https://'):  # Есть URL таблицы
-                    telegram_id = row[0] if len(row) > 0 else ''
-                    
-                    # Таблица доступна если:
-                    # 1. telegram_id пустой или начинается с TABLE_
-                    # 2. Или статус 'available' 
-                    is_available = (
-                        not telegram_id or 
-                        telegram_id.startswith('TABLE_') or
-                        (len(row) > 3 and row[3] and row[3].lower() == 'available')
-                    )
-                    
-                    if is_available:
-                        return AvailableTable(
-                            telegram_id=telegram_id,
-                            username=row[1] if len(row) > 1 else '',
-                            sheet_url=row[2],
-                            status=row[3] if len(row) > 3 else '',
-                            expires_at=row[4] if len(row) > 4 else '',
-                            created_at=row[5] if len(row) > 5 else ''
-                        ), i  # Возвращаем также номер строки
-            
-            print("❌ Нет доступных таблиц")
-            return None, None
+            # Ищем первую доступную таблицу (пустой telegram_id или TABLE_XX), пропуская заголовок
+            row_number, row = next(
+                ((i, row) for i, row in enumerate(values[1:], start=2) if _row_available(row)),
+                (None, None)
+            )
+            if row_number is None:
+                print("❌ Нет доступных таблиц")
+                return None, None
+            
+            # Дополняем строку до 6 колонок (A:F) - пустые хвостовые ячейки API не возвращает
+            telegram_id, username, sheet_url, status, expires_at, created_at = (row + [''] * 6)[:6]
+            return AvailableTable(
+                telegram_id=telegram_id,
+                username=username,
+                sheet_url=sheet_url,
+                status=status,
+                expires_at=expires_at,
+                created_at=created_at
+            ), row_number  # Возвращаем также номер строки
             
         except HttpError as e:
             print(f"❌ Ошибка чтения мастер-таблицы: {e}")
@@ -121,13 +167,11 @@ class TableAssignmentManager:
             print(f"🔍 Ищу доступную таблицу для {username} ({telegram_id})...")
             
             # Находим доступную таблицу
-            table_info = self.get_available_table()
-            if not table_info or len(table_info) != 2:
+            available_table, row_number = self.get_available_table()
+            if available_table is None:
                 print("❌ Нет доступных таблиц в пуле")
                 return None
             
-            available_table, row_number = table_info
-            
             # Обновляем строку в мастер-таблице
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             expires_at = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
@@ -150,6 +194,9 @@ class TableAssignmentManager:
                 body={'values': [updated_row]}
             ).execute()
             
+            # Строка изменилась - следующее чтение должно увидеть назначение
+            self._cache = None
+            
             print(f"✅ Таблица назначена пользователю {username}")
             print(f"🔗 URL: {available_table.sheet_url}")
             print(f"📅 Пробный период до: {expires_at}")
@@ -168,31 +215,9 @@ class TableAssignmentManager:
             Количество доступных таблиц
         """
         try:
-            result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=self.master_sheet_id,
-                range='A:F'
-            ).execute()
+            values = self._fetch_rows()
             
-            values = result.get('values', [])
-            count = 0
-            
-            for row in values[1:]:  # Пропускаем заголовок
-                if len(row) >= 3 and row[2].startswith('https://'):  # Есть URL таблицы
-                    telegram_id = row[0] if len(row) > 0 else ''
-                    
-                    # Таблица доступна если:
-                    # 1. telegram_id пустой или начинается с TABLE_
-                    # 2. Или статус 'available'
-                    is_available = (
-                        not telegram_id or 
-                        telegram_id.startswith('TABLE_') or
-                        (len(row) > 3 and row[3] and row[3].lower() == 'available')
-                    )
-                    
-                    if is_available:
-                        count += 1
-            
-            return count
+            return sum(1 for row in values[1:] if _row_available(row))  # Пропускаем заголовок
             
         except Exception as e:
             print(f"❌ Ошибка подсчета таблиц: {e}")
@@ -209,12 +234,7 @@ class TableAssignmentManager:
             URL таблицы или None если не найден
         """
         try:
-            result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=self.master_sheet_id,
-                range='A:F'
-            ).execute()
-            
-            values = result.get('values', [])
+            values = self._fetch_rows()
             
             for row in values[1:]:  # Пропускаем заголовок
                 if len(row) >= 3 and row[0] == telegram_id:
@@ -10,13 +10,17 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from datetime import datetime
 import asyncio
+import logging
 from bot import EventGREENBot
 from google_sheets_manager import GoogleSheetsManager
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
+# Текст каждого отправленного сообщения - только на уровне DEBUG (при 10k пользователей stdout тормозит)
+log = logging.getLogger("test_daily_notifications")
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class MockEvent:
     """Мок событие для тестирования"""
     name: str
@@ -26,7 +30,7 @@ class MockEvent:
     note: str
 
 
-@dataclass 
+@dataclass(frozen=True, slots=True)
 class MockUser:
     """Мок пользователь для тестирования"""
     telegram_id: str
@@ -35,33 +39,41 @@ class MockUser:
     sheet_url: str
 
 
+# Тестовые пользователи создаются один раз на модуль
+_MOCK_USERS = (
+    MockUser(
+        telegram_id="123456789",
+        username="test_user_1", 
+        status="trial",
+        sheet_url="https://docs.google.com/test1"
+    ),
+    MockUser(
+        telegram_id="987654321",
+        username="test_user_2",
+        status="pro", 
+        sheet_url="https://docs.google.com/test2"
+    )
+)
+
+
 class MockSheetsManager:
     """Мок Google Sheets Manager для тестирования"""
     
     def __init__(self, mock_events: List[MockEvent] = None):
         self.mock_events = mock_events or []
     
-    def get_all_trial_and_pro_users(self) -> List[MockUser]:
+    def get_all_trial_and_pro_users(self) -> Tuple[MockUser, ...]:
         """Возвращает тестовых пользователей"""
-        return [
-            MockUser(
-                telegram_id="123456789",
-                username="test_user_1", 
-                status="trial",
-                sheet_url="https://docs.google.com/test1"
-            ),
-            MockUser(
-                telegram_id="987654321",
-                username="test_user_2",
-                status="pro", 
-                sheet_url="https://docs.google.com/test2"
-            )
-        ]
+        return _MOCK_USERS
     
     def get_today_events(self, user: MockUser) -> List[MockEvent]:
         """Возвращает события на сегодня для пользователя"""
         return self.mock_events
     
+    def get_today_events_bulk(self, users: List[MockUser]) -> Dict[str, List[MockEvent]]:
+        """Возвращает события на сегодня для нескольких пользователей"""
+        return {user.telegram_id: self.get_today_events(user) for user in users}
+    
     def get_congratulations_map(self) -> dict:
         """Возвращает карту поздравлений"""
         return {
@@ -85,9 +97,7 @@ class MockBot:
             'parse_mode': parse_mode
         }
         self.sent_messages.append(message)
-        print(f"📤 MOCK: Отправлено сообщение в чат {chat_id}")
-        print(f"📝 Текст сообщения:\n{text}")
-        print("-" * 50)
+        log.debug("📤 MOCK: сообщение в чат %s:\n%s", chat_id, text)
 
 
 class MockApplication:
@@ -135,6 +145,10 @@ async def test_notifications_with_events():
     sent_messages = bot.application.bot.sent_messages
     print(f"✅ Отправлено {len(sent_messages)} сообщений")
     
+    # Каждый пользователь получает ровно одно сообщение (иначе циклы ниже пройдут впустую)
+    assert len(sent_messages) == len(_MOCK_USERS)
+    assert {msg['chat_id'] for msg in sent_messages} == {int(user.telegram_id) for user in _MOCK_USERS}
+    
     for msg in sent_messages:
         assert "События на сегодня" in msg['text']
         assert "Иван Петров" in msg['text']
@@ -165,6 +179,10 @@ async def test_notifications_without_events():
     sent_messages = bot.application.bot.sent_messages
     print(f"✅ Отправлено {len(sent_messages)} сообщений")
     
+    # Каждый пользователь получает ровно одно сообщение (иначе циклы ниже пройдут впустую)
+    assert len(sent_messages) == len(_MOCK_USERS)
+    assert {msg['chat_id'] for msg in sent_messages} == {int(user.telegram_id) for user in _MOCK_USERS}
+    
     for msg in sent_messages:
         assert "Сегодня праздников нет" in msg['text']
         assert "Отличный день для поиска новых клиентов" in msg['text']
@@ -183,11 +201,14 @@ async def main():
     print("=" * 60)
     
     try:
-        # Тест с событиями
-        await test_notifications_with_events()
-        
-        # Тест без событий  
-        await test_notifications_without_events()
+        # Тесты независимы (у каждого свой бот и MockApplication) - запускаем параллельно
+        if hasattr(asyncio, 'TaskGroup'):
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(test_notifications_with_events())
+                tg.create_task(test_notifications_without_events())
+        else:
+            # Python до 3.11 - без TaskGroup
+            await asyncio.gather(test_notifications_with_events(), test_notifications_without_events())
         
         print("\n" + "=" * 60)
         print("🎉 ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
@@ -205,6 +226,16 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Для просмотра текстов сообщений - level=logging.DEBUG
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    
+    # uvloop (если установлен) - тот же цикл событий, что и у бота
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    
     # Запускаем тесты
     result = asyncio.run(main())
     
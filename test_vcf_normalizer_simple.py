@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Тесты построчного разбора VCF в SimpleVCFNormalizer
+Проверяет vCard 2.1 (quoted-printable, base64), экранирование 3.0,
+перенос строк и группы свойств (item1.EMAIL)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from vcf_normalizer_simple import SimpleVCFNormalizer, Contact
+
+
+normalizer = SimpleVCFNormalizer()
+
+
+# Экспорт Android: кириллица в QUOTED-PRINTABLE с мягким переносом '='
+VCARD_21_QUOTED_PRINTABLE = (
+    "BEGIN:VCARD\r\n"
+    "VERSION:2.1\r\n"
+    "N;CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:;=D0=98=D0=B2=D0=B0=D0=BD;;;\r\n"
+    "FN;CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:=D0=98=D0=B2=D0=B0=D0=BD 12.05 =D0=94=D0=A0 5 =D0=BC=D0=B0=\r\n"
+    "=D1=8F\r\n"
+    "TEL;CELL:8 777 123 45 67\r\n"
+    "END:VCARD\r\n"
+)
+
+VCARD_21_BARE_PARAMS = (
+    "BEGIN:VCARD\r\n"
+    "VERSION:2.1\r\n"
+    "FN;CHARSET=UTF-8;QUOTED-PRINTABLE:=D0=90=D0=BD=D0=BD=D0=B0\r\n"
+    "NOTE;CHARSET=UTF-8;ENCODING=BASE64:0YHQstCw0LTRjNCx0LA=\r\n"
+    "END:VCARD\r\n"
+)
+
+VCARD_30_ESCAPING = (
+    "BEGIN:VCARD\r\n"
+    "VERSION:3.0\r\n"
+    "FN:Анна\\, юбилей\r\n"
+    "ORG:ООО Ромашка\\;филиал;Отдел\r\n"
+    "NOTE:строка1\\nстрока2\r\n"
+    "END:VCARD\r\n"
+)
+
+VCARD_30_FOLDED = (
+    "BEGIN:VCARD\r\n"
+    "VERSION:3.0\r\n"
+    "FN:Длинное имя кото\r\n"
+    " рое перенесено\r\n"
+    "NOTE:заметка\r\n"
+    "\t с табом\r\n"
+    "PHOTO;ENCODING=b;TYPE=JPEG:QUJD\r\n"
+    " QUJD\r\n"
+    "END:VCARD\r\n"
+)
+
+VCARD_30_GROUPED = (
+    "BEGIN:VCARD\r\n"
+    "VERSION:3.0\r\n"
+    "FN:Петр\r\n"
+    "item1.EMAIL;type=INTERNET:petr@mail.ru\r\n"
+    "item1.X-ABLabel:home\r\n"
+    "item2.TEL;type=CELL:+7 (701) 000-00-00\r\n"
+    "END:VCARD\r\n"
+)
+
+
+def test_quoted_printable_21():
+    """QUOTED-PRINTABLE с CHARSET и мягким переносом декодируется"""
+    assert normalizer.normalize_vcf(VCARD_21_QUOTED_PRINTABLE) == [
+        Contact(combined_text="Иван 12.05 ДР 5 мая", phone="+77771234567")
+    ]
+
+
+def test_bare_params_and_base64_21():
+    """Параметр без имени (;QUOTED-PRINTABLE) и ENCODING=BASE64"""
+    assert normalizer.normalize_vcf(VCARD_21_BARE_PARAMS) == [
+        Contact(combined_text="Анна свадьба", phone="")
+    ]
+
+
+def test_escaping_30():
+    """Экранирование 3.0 снимается, ORG делится по неэкранированной ';'"""
+    contacts = normalizer.normalize_vcf(VCARD_30_ESCAPING)
+    assert contacts == [
+        Contact(combined_text="Анна, юбилей ООО Ромашка;филиал Отдел строка1\nстрока2", phone="")
+    ]
+    assert contacts == normalizer.normalize_vcf(VCARD_30_ESCAPING, strict=True)
+
+
+def test_folded_lines_30():
+    """Строки-продолжения склеиваются, PHOTO пропускается"""
+    contacts = normalizer.normalize_vcf(VCARD_30_FOLDED)
+    assert contacts == [
+        Contact(combined_text="Длинное имя которое перенесено заметка с табом", phone="")
+    ]
+    assert contacts == normalizer.normalize_vcf(VCARD_30_FOLDED, strict=True)
+
+
+def test_grouped_properties_30():
+    """Группа item1. отбрасывается от имени свойства"""
+    contacts = normalizer.normalize_vcf(VCARD_30_GROUPED)
+    assert contacts == [Contact(combined_text="Петр petr@mail.ru", phone="+77010000000")]
+    assert contacts == normalizer.normalize_vcf(VCARD_30_GROUPED, strict=True)
+
+
+def test_bytes_input_matches_str():
+    """Байты декодируются по карточкам с тем же результатом"""
+    vcf_content = VCARD_21_QUOTED_PRINTABLE + VCARD_30_ESCAPING + VCARD_30_GROUPED
+    assert normalizer.normalize_vcf(vcf_content.encode("utf-8")) == normalizer.normalize_vcf(vcf_content)
@@ -4,34 +4,226 @@
 Возвращает combined_text и phone для каждого контакта
 """
 
+import base64
+import mmap
+import multiprocessing
+import quopri
+import os
 import vobject
-from typing import List, Dict
+from dataclasses import dataclass, asdict
+from typing import Iterator, List, Dict, Optional, Tuple, Union
 import re
 
+# Таблица для str.translate: удаляет из Latin-1 все, кроме цифр и плюса (один проход на C)
+_PHONE_DROP_TABLE = str.maketrans('', '', ''.join(chr(c) for c in range(256) if chr(c) not in '0123456789+'))
+
+# Запасной вариант для символов вне Latin-1 (кириллица, полноширинные цифры и т.п.)
+_PHONE_JUNK_RE = re.compile(r'[^\d+]')
+
+# Свойства, которые попадают в combined_text, и все свойства, которые вообще читаем.
+# Остальное (PHOTO, ADR, X-* и т.п.) отбрасывается сразу, вместе со строками-продолжениями
+_TEXT_PROPERTIES = ('FN', 'ORG', 'TITLE', 'NOTE', 'NICKNAME', 'EMAIL')
+_WANTED_PROPERTIES = frozenset(_TEXT_PROPERTIES + ('TEL',))
+
+# Те же свойства в виде ключей vcard.contents у vobject (в нижнем регистре)
+_TEXT_KEYS = tuple(name.lower() for name in _TEXT_PROPERTIES)
+
+# Экранирование текстовых значений vCard: \n, \, \; \\
+_VCARD_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+_ORG_SPLIT_RE = re.compile(r'(?<!\\);')
+
+# Начало карточки - по нему файл режется на блоки для параллельного разбора
+_VCARD_BEGIN_RE = re.compile(r'^BEGIN:VCARD[ \t]*\r?$', re.IGNORECASE | re.MULTILINE)
+_VCARD_BEGIN_BYTES_RE = re.compile(rb'^BEGIN:VCARD[ \t]*\r?$', re.IGNORECASE | re.MULTILINE)
+
+# Содержимое VCF: строка или байты (bytes, bytearray, mmap) - байты декодируются по карточкам
+VCFContent = Union[str, bytes, bytearray, mmap.mmap]
+
+# Параллельный разбор окупается только на больших файлах (старт пула ~50 мс и больше)
+PARALLEL_MIN_VCARDS = 2000
+PARALLEL_CHUNK_SIZE = 256
+
+
+@dataclass(frozen=True, slots=True)
+class Contact:
+    """Контакт из VCF: весь текст карточки и телефон"""
+    combined_text: str
+    phone: str
+    
+    def as_dict(self) -> Dict[str, str]:
+        """Словарь {combined_text, phone} (прежний формат результата)"""
+        return asdict(self)
+
+
+def _unescape(value: str) -> str:
+    """Снимает экранирование vCard с текстового значения"""
+    if '\\' not in value:
+        return value
+    return _VCARD_ESCAPE_RE.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def _property_name(line: str) -> str:
+    """Имя свойства без группы (item1.) и параметров (;TYPE=...)"""
+    colon = line.find(':')
+    head = line[:colon] if colon != -1 else line
+    return head.split(';', 1)[0].rsplit('.', 1)[-1].strip().upper()
+
+
+def _decode_property_value(logical: str) -> str:
+    """
+    Значение свойства из логической строки с учетом ENCODING и CHARSET
+
+    vCard 2.1 (экспорт Android) кодирует кириллицу как
+    FN;CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:=D0=98=D0=B2=D0=B0=D0=BD
+    """
+    colon = logical.find(':')
+    head, value = logical[:colon], logical[colon + 1:]
+    if ';' not in head:
+        return value
+
+    encoding = charset = None
+    for param in head.split(';')[1:]:
+        key, sep, param_value = param.partition('=')
+        key = key.strip().upper()
+        if not sep:
+            # Параметр без имени (vCard 2.1): ;QUOTED-PRINTABLE, ;BASE64
+            key, param_value = 'ENCODING', key
+        if key == 'ENCODING':
+            encoding = param_value.strip().strip('"').upper()
+        elif key == 'CHARSET':
+            charset = param_value.strip().strip('"')
+
+    try:
+        if encoding == 'QUOTED-PRINTABLE':
+            raw = quopri.decodestring(value.encode('utf-8'))
+        elif encoding in ('B', 'BASE64'):
+            raw = base64.b64decode(''.join(value.split()))
+        else:
+            return value
+        return raw.decode(charset or 'utf-8', errors='replace')
+    except (ValueError, LookupError):
+        # Битое кодирование или неизвестная кодировка - оставляем значение как есть
+        return value
+
+
+def _iter_vcards(vcf_content: str):
+    """
+    Построчно разбирает VCF и выдает словари {СВОЙСТВО: [значения]} по одному на карточку
+
+    Строки-продолжения (RFC 6350: начинаются с пробела или таба) склеиваются
+    только для нужных свойств, поэтому base64 из PHOTO не собирается в память.
+    Значения в QUOTED-PRINTABLE (с мягкими переносами '=') и BASE64 декодируются.
+    """
+    properties = None
+    name = None
+    parts = None  # части логической строки нужного свойства
+    quoted_printable = False
+    soft_break = False  # строка QP-значения закончилась мягким переносом '='
+
+    for line in vcf_content.splitlines():
+        if parts is not None and soft_break and not line.upper().startswith('END:VCARD'):
+            # Продолжение QP-значения идет следующей строкой как есть
+            parts[-1] = parts[-1][:-1]
+            parts.append(line)
+            soft_break = line.endswith('=')
+            continue
+
+        if line[:1] in (' ', '\t'):
+            if parts is not None:
+                parts.append(line[1:])
+                soft_break = quoted_printable and line.endswith('=')
+            continue
+
+        if parts is not None:
+            logical = ''.join(parts)
+            if ':' in logical:
+                properties.setdefault(name, []).append(_decode_property_value(logical))
+            parts = None
+
+        name = _property_name(line)
+        if name == 'BEGIN':
+            if line.partition(':')[2].strip().upper() == 'VCARD':
+                properties = {}
+        elif name == 'END':
+            if properties is not None and line.partition(':')[2].strip().upper() == 'VCARD':
+                yield properties
+                properties = None
+        elif properties is not None and name in _WANTED_PROPERTIES:
+            parts = [line]
+            quoted_printable = 'QUOTED-PRINTABLE' in line.partition(':')[0].upper()
+            soft_break = quoted_printable and line.endswith('=')
+
+
+def _vcard_block_bounds(vcf_content: VCFContent) -> List[Tuple[int, int]]:
+    """Границы блоков по одной карточке (по строкам BEGIN:VCARD)"""
+    begin_re = _VCARD_BEGIN_RE if isinstance(vcf_content, str) else _VCARD_BEGIN_BYTES_RE
+    starts = [match.start() for match in begin_re.finditer(vcf_content)]
+    return list(zip(starts, starts[1:] + [len(vcf_content)]))
+
+
+def _decode_block(block: Union[str, bytes]) -> str:
+    """Декодирует блок карточки из UTF-8 (битые байты заменяются, а не роняют файл)"""
+    return block if isinstance(block, str) else block.decode('utf-8', errors='replace')
+
+
+def _iter_vcard_texts(vcf_content: VCFContent) -> Iterator[str]:
+    """
+    Текст VCF для построчного разбора
+    
+    Строка отдается целиком. Байты декодируются по одной карточке, поэтому
+    весь файл никогда не превращается в str (для кириллицы это 2-4 байта на символ).
+    """
+    if isinstance(vcf_content, str):
+        yield vcf_content
+        return
+    
+    for start, end in _vcard_block_bounds(vcf_content):
+        yield _decode_block(vcf_content[start:end])
+
+
 class SimpleVCFNormalizer:
     """Простой нормализатор VCF файлов"""
     
     def __init__(self):
         pass
     
-    def normalize_vcf(self, vcf_content: str) -> List[Dict[str, str]]:
+    def normalize_vcf(self, vcf_content: VCFContent, strict: bool = False) -> List[Contact]:
         """
         Нормализует VCF файл в простой формат
         
         Args:
-            vcf_content: содержимое VCF файла
+            vcf_content: содержимое VCF файла (str или байты, например mmap)
+            strict: разбирать через vobject (полная грамматика vCard, медленнее)
             
         Returns:
-            Список словарей с combined_text и phone
+            Список Contact (combined_text и phone)
         """
         contacts = []
         
         try:
-            # Парсим VCF
-            vcf_objects = vobject.readComponents(vcf_content)
+            if strict:
+                # Парсим VCF через vobject (ему нужна строка целиком)
+                if not isinstance(vcf_content, str):
+                    vcf_content = _decode_block(bytes(vcf_content))
+                vcards = vobject.readComponents(vcf_content)
+                extract = self._extract_contact_data
+            else:
+                # Построчный разбор только нужных полей
+                vcards = (
+                    properties
+                    for text in _iter_vcard_texts(vcf_content)
+                    for properties in _iter_vcards(text)
+                )
+                extract = self._extract_contact_from_properties
             
-            for vcard in vcf_objects:
-                contact = self._extract_contact_data(vcard)
+            for vcard in vcards:
+                try:
+                    contact = extract(vcard)
+                except Exception as e:
+                    # Битая карточка не должна ронять весь файл
+                    print(f"Ошибка разбора карточки VCF: {e}")
+                    continue
+                
                 if contact:  # Только если есть хоть какие-то данные
                     contacts.append(contact)
                     
@@ -42,42 +234,101 @@ class SimpleVCFNormalizer:
         print(f"Извлечено {len(contacts)} контактов из VCF")
         return contacts
     
-    def _extract_contact_data(self, vcard) -> Dict[str, str]:
-        """Извлекает все данные из одной карточки"""
+    def normalize_vcf_parallel(self, vcf_content: VCFContent, workers: int = None) -> List[Contact]:
+        """
+        Нормализует большой VCF файл в несколько процессов
         
-        all_text_parts = []
-        phone = ""
+        Файл режется на карточки, которые разбираются в multiprocessing.Pool
+        (байтовые блоки передаются в процессы как есть и декодируются там).
+        Для файлов до PARALLEL_MIN_VCARDS карточек - обычный normalize_vcf.
         
-        # Проходим по всем свойствам карточки
-        for property_name in vcard.contents:
-            try:
-                properties = vcard.contents[property_name]
-                
-                for prop in properties:
-                    # Извлекаем телефон отдельно
-                    if property_name.lower() == 'tel':
-                        if not phone:  # Берем первый найденный телефон
-                            phone = self._clean_phone(str(prop.value))
-                    
-                    # Все остальное - в combined_text (исключаем N чтобы избежать дублирования с FN)
-                    elif property_name.lower() in ['fn', 'org', 'title', 'note', 'nickname', 'email']:
-                        text_value = self._extract_text_value(prop)
-                        if text_value:
-                            all_text_parts.append(text_value)
+        Args:
+            vcf_content: содержимое VCF файла (str или байты)
+            workers: количество процессов (по умолчанию - по числу ядер)
             
-            except Exception as e:
-                # Игнорируем ошибки отдельных полей
-                continue
+        Returns:
+            Список Contact (в порядке карточек в файле)
+        """
+        workers = workers or os.cpu_count() or 1
+        
+        # Для подсчета карточек хватает границ - сами блоки копируются только для пула
+        bounds = _vcard_block_bounds(vcf_content)
+        if workers < 2 or len(bounds) <= PARALLEL_MIN_VCARDS:
+            return self.normalize_vcf(vcf_content)
+        
+        # Блоки вырезаются лениво, по мере того как imap отдает их процессам (байты остаются байтами)
+        blocks = (vcf_content[start:end] for start, end in bounds)
+        
+        try:
+            # spawn, а не fork: в процессе бота работают потоки планировщика и HTTP-клиентов
+            with multiprocessing.get_context('spawn').Pool(workers) as pool:
+                contacts = [
+                    contact
+                    for contact in pool.imap(_parse_single_vcard_str, blocks, chunksize=PARALLEL_CHUNK_SIZE)
+                    if contact
+                ]
+        except Exception as e:
+            print(f"Ошибка параллельного парсинга VCF: {e}, разбираю в одном процессе")
+            return self.normalize_vcf(vcf_content)
+        
+        print(f"Извлечено {len(contacts)} контактов из VCF ({workers} процессов)")
+        return contacts
+    
+    def _extract_contact_data(self, vcard) -> Optional[Contact]:
+        """
+        Извлекает все данные из одной карточки
+        
+        Ошибки не перехватывает - битую карточку пропускает normalize_vcf.
+        """
+        contents = vcard.contents
+        
+        # Телефон отдельно - берем первый непустой
+        phone = next(
+            filter(None, (self._clean_phone(str(prop.value)) for prop in contents.get('tel', ()))),
+            ""
+        )
+        
+        # Все остальное - в combined_text (исключаем N чтобы избежать дублирования с FN)
+        all_text_parts = [
+            text_value
+            for key in _TEXT_KEYS
+            for prop in contents.get(key, ())
+            if (text_value := self._extract_text_value(prop))
+        ]
+        
+        return self._build_contact(all_text_parts, phone)
+    
+    def _extract_contact_from_properties(self, properties: Dict[str, List[str]]) -> Optional[Contact]:
+        """Извлекает данные из карточки, разобранной _iter_vcards"""
         
+        # Телефон отдельно - берем первый непустой
+        phone = next(filter(None, map(self._clean_phone, properties.get('TEL', ()))), "")
+        
+        # Порядок полей тот же, что и в _extract_contact_data
+        all_text_parts = []
+        for property_name in _TEXT_PROPERTIES:
+            for value in properties.get(property_name, ()):
+                if property_name == 'ORG':
+                    # ORG - структурное поле: компания;отдел;...
+                    text_value = ' '.join(
+                        part for part in map(_unescape, _ORG_SPLIT_RE.split(value)) if part.strip()
+                    )
+                else:
+                    text_value = _unescape(value).strip()
+                
+                if text_value:
+                    all_text_parts.append(text_value)
+        
+        return self._build_contact(all_text_parts, phone)
+    
+    def _build_contact(self, all_text_parts: List[str], phone: str) -> Optional[Contact]:
+        """Собирает итоговый контакт"""
         # Объединяем весь текст (БЕЗ телефона - он отдельное поле)
         combined_text = ' '.join(all_text_parts).strip()
         
         # Возвращаем только если есть хоть что-то полезное
         if combined_text or phone:
-            return {
-                'combined_text': combined_text,
-                'phone': phone
-            }
+            return Contact(combined_text=combined_text, phone=phone)
         
         return None
     
@@ -109,8 +360,15 @@ class SimpleVCFNormalizer:
         if not phone:
             return ""
         
-        # Убираем все кроме цифр и плюса
-        cleaned = re.sub(r'[^\d+]', '', phone)
+        # Быстрый путь: номер уже чистый (+77771234567 или 87771234567)
+        # isdecimal совпадает с \d регулярки, поэтому результат тот же
+        if phone.isdecimal() or (phone[0] == '+' and phone[1:].isdecimal()):
+            cleaned = phone
+        else:
+            # Убираем все кроме цифр и плюса
+            cleaned = phone.translate(_PHONE_DROP_TABLE)
+            if not cleaned.isascii():
+                cleaned = _PHONE_JUNK_RE.sub('', cleaned)
         
         # Если номер начинается с 8, заменяем на +7 (для России/Казахстана)
         if cleaned.startswith('8') and len(cleaned) == 11:
@@ -118,10 +376,19 @@ class SimpleVCFNormalizer:
         
         return cleaned
 
-# Тестирование
-if __name__ == "__main__":
-    import os
-    
+
+_normalizer = SimpleVCFNormalizer()
+
+
+def _parse_single_vcard_str(block: Union[str, bytes]) -> Optional[Contact]:
+    """Разбирает одну карточку (функция модуля - чтобы передавать в Pool)"""
+    for properties in _iter_vcards(_decode_block(block)):
+        return _normalizer._extract_contact_from_properties(properties)
+    return None
+
+
+def _main():
+    """Ручная проверка на реальном файле (файл отображается в память через mmap)"""
     normalizer = SimpleVCFNormalizer()
     
     # Тестируем на реальном файле
@@ -131,10 +398,9 @@ if __name__ == "__main__":
         print("🧪 ТЕСТ ПРОСТОГО VCF NORMALIZER")
         print("=" * 50)
         
-        with open(vcf_path, 'r', encoding='utf-8') as f:
-            vcf_content = f.read()
-        
-        contacts = normalizer.normalize_vcf(vcf_content)
+        # Карточки декодируются по одной прямо из отображения файла
+        with open(vcf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as vcf_content:
+            contacts = normalizer.normalize_vcf(vcf_content)
         
         print(f"📊 Обработано контактов: {len(contacts)}")
         
@@ -142,14 +408,14 @@ if __name__ == "__main__":
         print("\n📋 ПЕРВЫЕ 10 КОНТАКТОВ:")
         print("-" * 80)
         for i, contact in enumerate(contacts[:10], 1):
-            print(f"{i:2d}. Combined: {contact['combined_text'][:60]}...")
-            print(f"    Phone: {contact['phone']}")
+            print(f"{i:2d}. Combined: {contact.combined_text[:60]}...")
+            print(f"    Phone: {contact.phone}")
             print()
         
         # Статистика
-        with_text = sum(1 for c in contacts if c['combined_text'])
-        with_phone = sum(1 for c in contacts if c['phone'])
-        avg_text_length = sum(len(c['combined_text']) for c in contacts) / len(contacts) if contacts else 0
+        with_text = sum(1 for c in contacts if c.combined_text)
+        with_phone = sum(1 for c in contacts if c.phone)
+        avg_text_length = sum(len(c.combined_text) for c in contacts) / len(contacts) if contacts else 0
         
         print(f"📈 СТАТИСТИКА:")
         print(f"   Контактов с текстом: {with_text}")
@@ -157,4 +423,9 @@ if __name__ == "__main__":
         print(f"   Средняя длина текста: {avg_text_length:.0f} символов")
         
     else:
-        print(f"❌ VCF файл не найден: {vcf_path}")
\ No newline at end of file
+        print(f"❌ VCF файл не найден: {vcf_path}")
+
+
+# Тестирование
+if __name__ == "__main__":
+    _main()